@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+色盲测试图像的期望答案提取
+评测框架(evaluation_framework.py)和评测演示(demo_evaluation.py)共用
+"""
+
+import re
+from functools import lru_cache
+
+# GitHub学习数据集文件名中的答案，形如 xxx_12_xxx
+_LEARNING_NUM_RE = re.compile(r'_(\d+)_')
+_DIGIT_RE = re.compile(r'\d+')
+
+# 形状类图像的答案关键词
+ANSWER_KEYWORDS = ('circle', 'square', 'triangle', 'diamond', 'star')
+
+
+@lru_cache(maxsize=None)
+def extract_answer(filename: str) -> str:
+    """
+    从基础图像文件名提取期望答案（按文件名缓存）
+
+    Args:
+        filename: 基础图像文件名或目录名
+
+    Returns:
+        数字答案字符串、形状关键词，或"unknown"
+    """
+    # GitHub学习数据集：答案是下划线包围的数字
+    if "learning" in filename:
+        number_match = _LEARNING_NUM_RE.search(filename)
+        if number_match:
+            return number_match.group(1)
+
+    # 检查数字
+    number_match = _DIGIT_RE.search(filename)
+    if number_match:
+        return number_match.group()
+
+    # 检查关键词
+    filename_lower = filename.lower()
+    for keyword in ANSWER_KEYWORDS:
+        if keyword in filename_lower:
+            return keyword
+
+    return "unknown"
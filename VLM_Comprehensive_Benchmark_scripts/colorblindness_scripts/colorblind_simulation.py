@@ -7,9 +7,193 @@
 import numpy as np
 from PIL import Image
 import colorsys
-import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+from io_utils import json_dumps, read_jsonl
+
+# generate_gradients支持的输出格式
+GRADIENT_OUTPUT_FORMATS = ('png', 'jpg', 'npz', 'webp')
+
+# apply_colorblindness_matrix分块处理时每块的像素数（约对应L2缓存大小）
+TILE_PIXELS = 32768
+
+# 梯度图像的保存参数：PNG使用快速压缩（文件约大10-30%，编码快数倍）；
+# WebP无损、method=0时编码更快且文件更小
+GRADIENT_SAVE_OPTIONS = {
+    'png': dict(format='PNG', compress_level=1, optimize=False),
+    'webp': dict(format='WebP', lossless=True, quality=0, method=0),
+}
+
+# 批量生成梯度帧时每批float32中间结果的上限（字节），避免101帧同时驻留内存
+GRADIENT_BATCH_BYTES = 64 * 1024 * 1024
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True, boundscheck=False)
+    def _apply_cb(src, dst, mT, severity):
+        """单遍完成 归一化 -> 3x3矩阵 -> 严重程度混合 -> 裁剪 -> 量化"""
+        height, width = src.shape[0], src.shape[1]
+        scale = 1.0 / 255.0
+        for y in prange(height):
+            for x in range(width):
+                r = src[y, x, 0] * scale
+                g = src[y, x, 1] * scale
+                b = src[y, x, 2] * scale
+                nr = mT[0, 0] * r + mT[1, 0] * g + mT[2, 0] * b
+                ng = mT[0, 1] * r + mT[1, 1] * g + mT[2, 1] * b
+                nb = mT[0, 2] * r + mT[1, 2] * g + mT[2, 2] * b
+                nr = r + severity * (nr - r)
+                ng = g + severity * (ng - g)
+                nb = b + severity * (nb - b)
+                dst[y, x, 0] = min(255, max(0, int(nr * 255.0 + 0.5)))
+                dst[y, x, 1] = min(255, max(0, int(ng * 255.0 + 0.5)))
+                dst[y, x, 2] = min(255, max(0, int(nb * 255.0 + 0.5)))
+    
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _mean_gradient_magnitude(gray):
+        """单遍计算中心差分梯度幅值的均值（与np.gradient边界处理一致）"""
+        height, width = gray.shape
+        total = 0.0
+        for y in prange(height):
+            for x in range(width):
+                if x == 0:
+                    gx = gray[y, 1] - gray[y, 0]
+                elif x == width - 1:
+                    gx = gray[y, x] - gray[y, x - 1]
+                else:
+                    gx = (gray[y, x + 1] - gray[y, x - 1]) * 0.5
+                if y == 0:
+                    gy = gray[1, x] - gray[0, x]
+                elif y == height - 1:
+                    gy = gray[y, x] - gray[y - 1, x]
+                else:
+                    gy = (gray[y + 1, x] - gray[y - 1, x]) * 0.5
+                total += np.sqrt(gx * gx + gy * gy)
+        return total / (height * width)
+    
+    @njit(parallel=True, cache=True)
+    def _mean_abs_diff_u8(a, b):
+        """两个uint8数组的平均绝对差；空数组返回nan（与np.mean一致）"""
+        if a.size == 0:
+            return np.nan
+        total = 0
+        for i in prange(a.size):
+            total += abs(np.int32(a[i]) - np.int32(b[i]))
+        return total / a.size
+
+
+@lru_cache(maxsize=None)
+def gpu_available():
+    """是否有可用的CUDA设备
+    
+    首次调用时才探测设备：探测会初始化CUDA，初始化后fork出的子进程无法再使用CUDA，
+    因此不能在导入时进行。
+    """
+    if cp is None:
+        return False
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=None)
+def _gradient_kernel():
+    """一次生成所有严重程度帧的CUDA内核（首次使用时编译）：x为原图，f为完全变换结果，s为严重程度"""
+    return cp.ElementwiseKernel(
+        'float32 x, float32 f, float32 s',
+        'uint8 o',
+        'o = (unsigned char)(min(255.f, max(0.f, (x + s * (f - x)) * 255.f + 0.5f)))',
+        'colorblind_gradient'
+    )
+
+
+def _use_gpu(device):
+    """根据device参数判断是否使用GPU"""
+    if device == 'cuda':
+        if not gpu_available():
+            raise RuntimeError("未检测到可用的CUDA设备（需要安装cupy）")
+        return True
+    return device == 'auto' and gpu_available()
+
+
+def _render_frames(img_f, matrices):
+    """一次批量矩阵乘法生成多个严重程度的帧
+    
+    Args:
+        img_f: (H, W, 3) float32像素（0-255）
+        matrices: (S, 3, 3) 变换矩阵
+    
+    Returns:
+        (S, H, W, 3) uint8帧
+    """
+    # optimize=True时einsum转为一次BLAS张量收缩，而不是逐帧的小矩阵乘法
+    stacked = np.einsum('hwc,sdc->shwd', img_f, matrices, optimize=True)
+    np.clip(stacked, 0, 255, out=stacked)
+    np.rint(stacked, out=stacked)
+    return stacked.astype(np.uint8)
+
+
+def _save_frame(frame, filepath, save_options):
+    """在写线程中保存一帧（Pillow编码时释放GIL）"""
+    Image.fromarray(frame).save(filepath, **save_options)
+
+
+class FrameWriter:
+    """在后台线程中保存uint8帧，限制同时等待保存的帧数
+    
+    待保存的帧达到max_pending时，先等待最早提交的帧写完再接受新帧，
+    因此即使生成帧比编码快，内存中也最多只保留max_pending帧。
+    提交的帧在写完之前不能被修改。
+    """
+    
+    def __init__(self, max_workers=4, max_pending=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending or 2 * max_workers
+        self.pending = deque()
+    
+    def save(self, frame, filepath, **save_options):
+        """提交一帧的保存；save_options直接传给PIL的Image.save"""
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(_save_frame, frame, filepath, save_options))
+    
+    def wait(self):
+        """等待所有已提交的帧写完，写盘错误在此抛出"""
+        pending, self.pending = self.pending, deque()
+        for future in pending:
+            future.result()
+    
+    def close(self):
+        self.executor.shutdown()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.close()
+
+
 class ColorBlindnessSimulator:
     def __init__(self):
         """初始化色盲模拟器，包含不同色盲类型的变换矩阵"""
@@ -53,59 +237,168 @@ class ColorBlindnessSimulator:
             [-0.078411, 0.930809, 0.147602],
             [0.004733, 0.691367, 0.303900]
         ])
+        
+        # 按属性名索引的矩阵，预先转置为连续的float32，避免热路径上重复转置和类型转换
+        self._matrices = {
+            name: getattr(self, name)
+            for name in ('protanopia_matrix', 'deuteranopia_matrix', 'tritanopia_matrix',
+                         'improved_protanopia', 'improved_deuteranopia', 'improved_tritanopia')
+        }
+        self._mT = {
+            name: np.ascontiguousarray(matrix.T, dtype=np.float32)
+            for name, matrix in self._matrices.items()
+        }
+        
+        # 定点查找表 (Q8): lut[i, j, v] = round(matrix[i, j] * v * 256)
+        # 定点矩阵 (Q16): round(matrix * 65536)，用于severity=1.0的整数矩阵乘法
+        self._luts = {}
+        self._fixed_point_matrices = {}
+        for matrix in self._matrices.values():
+            self._get_lut(matrix)
+            self._get_fixed_point_matrix(matrix)
     
-    def apply_colorblindness_matrix(self, image, matrix, severity=1.0):
+    def _get_lut(self, matrix):
+        """获取(必要时构建)矩阵对应的(3, 3, 256) int32定点查找表"""
+        key = np.asarray(matrix, dtype=np.float64).tobytes()
+        lut = self._luts.get(key)
+        if lut is None:
+            values = np.arange(256, dtype=np.float64)
+            lut = np.rint(np.asarray(matrix, dtype=np.float64)[:, :, None] * values * 256).astype(np.int32)
+            self._luts[key] = lut
+        return lut
+    
+    def _get_fixed_point_matrix(self, matrix):
+        """获取(必要时构建)矩阵对应的Q16 int32定点矩阵"""
+        key = np.asarray(matrix, dtype=np.float64).tobytes()
+        fixed = self._fixed_point_matrices.get(key)
+        if fixed is None:
+            fixed = np.rint(np.asarray(matrix, dtype=np.float64) * 65536).astype(np.int32)
+            self._fixed_point_matrices[key] = fixed
+        return fixed
+    
+    def apply_colorblindness_matrix(self, image, matrix, severity=1.0, device='auto'):
         """应用色盲变换矩阵到图像
         
         Args:
-            image: PIL Image对象
-            matrix: 3x3变换矩阵
+            image: PIL Image对象或(H, W, 3) uint8数组
+            matrix: 3x3变换矩阵，或预编译矩阵的名称（如'improved_protanopia'）
             severity: 色盲严重程度 (0.0-1.0)
+            device: 'auto'（有CUDA设备时使用GPU）、'cuda' 或 'cpu'
         
         Returns:
             处理后的PIL Image对象
         """
-        # 转换为numpy数组
-        img_array = np.array(image, dtype=np.float32) / 255.0
-        original_shape = img_array.shape
+        return Image.fromarray(self.apply_colorblindness_matrix_array(image, matrix, severity, device))
+    
+    def apply_colorblindness_matrix_array(self, image, matrix, severity=1.0, device='auto'):
+        """与apply_colorblindness_matrix相同，但返回(H, W, 3) uint8数组，不构造PIL Image"""
+        src = np.asarray(image)
+        original_shape = src.shape
         
         # 确保是RGB格式
-        if len(original_shape) == 3 and original_shape[2] == 3:
-            # 重塑为(pixel_count, 3)
-            pixels = img_array.reshape(-1, 3)
-        else:
+        if len(original_shape) != 3 or original_shape[2] != 3:
             raise ValueError("图像必须是RGB格式")
         
-        # 应用变换矩阵
-        transformed_pixels = np.dot(pixels, matrix.T)
+        if isinstance(matrix, str):
+            matrix_t = self._mT[matrix]
+            matrix = self._matrices[matrix]
+        else:
+            matrix_t = np.ascontiguousarray(np.asarray(matrix).T, dtype=np.float32)
         
-        # 按严重程度混合原始和变换后的颜色
-        if severity < 1.0:
-            transformed_pixels = (1 - severity) * pixels + severity * transformed_pixels
+        if _use_gpu(device):
+            return self.apply_colorblindness_matrix_gpu(src, matrix_t, severity)
         
-        # 限制到有效范围并转换回uint8
-        transformed_pixels = np.clip(transformed_pixels, 0, 1)
-        transformed_image = (transformed_pixels * 255).astype(np.uint8)
+        if NUMBA_AVAILABLE and src.dtype == np.uint8:
+            dst = np.empty_like(src)
+            _apply_cb(src, dst, matrix_t, np.float32(severity))
+            return dst
         
-        # 重塑回原始形状
-        transformed_image = transformed_image.reshape(original_shape)
+        # 按行分块处理，使每块的中间结果都留在L2缓存中
+        dst = np.empty(original_shape, dtype=np.uint8)
+        rows = max(1, TILE_PIXELS // max(1, original_shape[1]))
+        for y in range(0, original_shape[0], rows):
+            dst[y:y + rows] = self._transform_tile(src[y:y + rows], matrix, matrix_t, severity)
         
-        return Image.fromarray(transformed_image)
+        return dst
+    
+    def _transform_tile(self, src, matrix, matrix_t, severity):
+        """对一个(rows, W, 3)图像块应用色盲变换，返回uint8数组"""
+        tile_shape = src.shape
+        
+        if src.dtype == np.uint8 and severity == 1.0:
+            # 完全色盲（simulate_*的默认值）：单次整数矩阵乘法，无需混合
+            raw = src.reshape(-1, 3).astype(np.int32)
+            out = (raw @ self._get_fixed_point_matrix(matrix).T + (1 << 15)) >> 16
+            np.clip(out, 0, 255, out=out)
+            return out.astype(np.uint8).reshape(tile_shape)
+        
+        if src.dtype == np.uint8:
+            # 定点流水线：查表累加，不做任何浮点运算
+            lut = self._get_lut(matrix)
+            r, g, b = src[..., 0], src[..., 1], src[..., 2]
+            dst = np.empty_like(src)
+            severity_q16 = int(round(severity * 65536))
+            for c in range(3):
+                acc = lut[c, 0][r] + lut[c, 1][g] + lut[c, 2][b]
+                if severity_q16 < 65536:
+                    base = src[..., c].astype(np.int64) << 8
+                    acc = base + (((acc - base) * severity_q16) >> 16)
+                dst[..., c] = np.clip((acc + 128) >> 8, 0, 255)
+            return dst
+        
+        # 转换为通道平面(SoA)布局：三个连续的float32平面
+        img_array = src.astype(np.float32) / 255.0
+        planes = [np.ascontiguousarray(img_array[..., c]) for c in range(3)]
+        
+        # 每个输出通道 = m[i,0]*R + m[i,1]*G + m[i,2]*B，全部原地计算
+        outputs = []
+        tmp = np.empty_like(planes[0])
+        for i in range(3):
+            out = np.multiply(planes[0], matrix_t[0, i], out=np.empty_like(planes[0]))
+            for j in (1, 2):
+                np.multiply(planes[j], matrix_t[j, i], out=tmp)
+                np.add(out, tmp, out=out)
+            
+            # 按严重程度混合原始和变换后的颜色
+            if severity < 1.0:
+                np.subtract(out, planes[i], out=out)
+                np.multiply(out, severity, out=out)
+                np.add(out, planes[i], out=out)
+            
+            # 限制到有效范围并量化（四舍五入，与JIT内核一致）
+            np.clip(out, 0, 1, out=out)
+            np.multiply(out, 255, out=out)
+            np.rint(out, out=out)
+            outputs.append(out)
+        
+        return np.stack(outputs, axis=-1).astype(np.uint8)
+    
+    def apply_colorblindness_matrix_gpu(self, img_u8, matrix_t, severity=1.0):
+        """在GPU上应用色盲变换矩阵（传入转置后的矩阵），返回uint8 numpy数组"""
+        x = cp.asarray(img_u8, dtype=cp.float32) * (1 / 255.0)
+        y = x @ cp.asarray(matrix_t)
+        z = x + severity * (y - x)
+        return cp.rint(cp.clip(z, 0, 1) * 255).astype(cp.uint8).get()
+    
+    def simulate_array(self, img_arr, colorblind_type, severity=1.0, improved=True):
+        """对(H, W, 3) uint8数组模拟色盲，返回uint8数组
+        
+        同一图像模拟多个严重程度时，先转换为数组再反复调用，避免每次重新转换PIL图像。
+        """
+        key = f'improved_{colorblind_type}' if improved else f'{colorblind_type}_matrix'
+        return self.apply_colorblindness_matrix_array(img_arr, key, severity)
     
     def simulate_protanopia(self, image, severity=1.0, improved=True):
         """模拟红色盲"""
-        matrix = self.improved_protanopia if improved else self.protanopia_matrix
-        return self.apply_colorblindness_matrix(image, matrix, severity)
+        return Image.fromarray(self.simulate_array(image, 'protanopia', severity, improved))
     
     def simulate_deuteranopia(self, image, severity=1.0, improved=True):
         """模拟绿色盲"""
-        matrix = self.improved_deuteranopia if improved else self.deuteranopia_matrix
-        return self.apply_colorblindness_matrix(image, matrix, severity)
+        return Image.fromarray(self.simulate_array(image, 'deuteranopia', severity, improved))
     
     def simulate_tritanopia(self, image, severity=1.0, improved=True):
         """模拟蓝色盲"""
-        matrix = self.improved_tritanopia if improved else self.tritanopia_matrix
-        return self.apply_colorblindness_matrix(image, matrix, severity)
+        return Image.fromarray(self.simulate_array(image, 'tritanopia', severity, improved))
     
     def simulate_protanomaly(self, image, severity=0.5):
         """模拟红色弱视"""
@@ -119,69 +412,219 @@ class ColorBlindnessSimulator:
         """模拟蓝色弱视"""
         return self.simulate_tritanopia(image, severity)
     
-    def generate_gradients(self, image, colorblind_type, num_steps=100, output_dir="gradients"):
+    def severity_matrices(self, colorblind_types, num_steps=100):
+        """预计算每种色盲类型在各严重程度下的3x3变换矩阵
+        
+        按严重程度s混合原图和完全变换结果等价于一次矩阵乘法：
+        x + s * (M @ x - x) = ((1 - s) * I + s * M) @ x
+        
+        Returns:
+            {色盲类型: (num_steps + 1, 3, 3) float32数组}，第step个对应严重程度step/num_steps
+        """
+        severities = (np.arange(num_steps + 1) / num_steps)[:, None, None]
+        identity = np.eye(3)
+        return {
+            colorblind_type: (
+                (1 - severities) * identity + severities * getattr(self, f'improved_{colorblind_type}')
+            ).astype(np.float32)
+            for colorblind_type in colorblind_types
+        }
+    
+    def iter_severity_frames(self, img_arr, matrices, use_gpu=False):
+        """按顺序逐帧产生应用各矩阵后的uint8帧
+        
+        use_gpu时在GPU上按批做einsum，只下载uint8结果；有Numba时逐帧调用JIT内核，
+        没有大块临时数组；否则按GRADIENT_BATCH_BYTES分批用einsum生成。
+        每帧都是独立的数组，可以交给FrameWriter异步保存。
+        
+        Args:
+            img_arr: (H, W, 3) uint8数组
+            matrices: (S, 3, 3) 变换矩阵，如severity_matrices结果中的一项
+            use_gpu: 是否在GPU上生成
+        """
+        if use_gpu:
+            img_gpu = cp.asarray(img_arr, dtype=cp.float32)
+            batch_size = max(1, GRADIENT_BATCH_BYTES // img_gpu.nbytes)
+            for start in range(0, len(matrices), batch_size):
+                stacked = cp.einsum('hwc,sdc->shwd', img_gpu, cp.asarray(matrices[start:start + batch_size]))
+                yield from cp.rint(cp.clip(stacked, 0, 255)).astype(cp.uint8).get()
+            return
+        
+        if NUMBA_AVAILABLE:
+            # 混合后的矩阵已包含严重程度，按severity=1.0应用即可
+            for matrix in matrices:
+                yield self.apply_colorblindness_matrix_array(img_arr, matrix, 1.0, device='cpu')
+            return
+        
+        img_f = img_arr.astype(np.float32)
+        batch_size = max(1, GRADIENT_BATCH_BYTES // img_f.nbytes)
+        for start in range(0, len(matrices), batch_size):
+            yield from _render_frames(img_f, matrices[start:start + batch_size])
+    
+    def generate_gradients(self, image, colorblind_type, num_steps=100, output_dir="gradients",
+                           output_format='png', device='auto'):
         """生成色盲模拟的渐变序列
         
         Args:
-            image: 输入的PIL Image
+            image: 输入的PIL Image或(H, W, 3) uint8数组
             colorblind_type: 色盲类型 ('protanopia', 'deuteranopia', 'tritanopia')
             num_steps: 渐变步数
             output_dir: 输出目录
+            output_format: 输出格式 ('png', 'jpg', 'npz', 'webp')；
+                'npz'和'webp'将所有帧打包为单个文件
+            device: 'auto'（有CUDA设备时使用GPU）、'cuda' 或 'cpu'
         
         Returns:
             生成的图像文件路径列表
         """
-        output_path = Path(output_dir)
-        output_path.mkdir(parents=True, exist_ok=True)
+        return self.generate_gradients_multi(
+            image, [colorblind_type], num_steps, output_dir, output_format, device,
+            type_subdirs=False
+        )[colorblind_type]
+    
+    def generate_gradients_multi(self, image, colorblind_types, num_steps=100, output_dir="gradients",
+                                 output_format='png', device='auto', type_subdirs=True):
+        """为多种色盲类型生成渐变序列，所有类型共用一次矩阵乘法
         
-        # 获取模拟函数
-        simulation_functions = {
-            'protanopia': self.simulate_protanopia,
-            'deuteranopia': self.simulate_deuteranopia,
-            'tritanopia': self.simulate_tritanopia
-        }
+        Args:
+            image: 输入的PIL Image或(H, W, 3) uint8数组
+            colorblind_types: 色盲类型列表
+            num_steps: 渐变步数
+            output_dir: 输出目录
+            output_format: 输出格式 ('png', 'jpg', 'npz', 'webp')
+            device: 'auto'（有CUDA设备时使用GPU）、'cuda' 或 'cpu'
+            type_subdirs: 是否为每种类型创建 output_dir/<类型> 子目录
+        
+        Returns:
+            {色盲类型: 生成的图像文件路径列表}
+        """
+        if output_format not in GRADIENT_OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
         
-        if colorblind_type not in simulation_functions:
-            raise ValueError(f"不支持的色盲类型: {colorblind_type}")
+        # 与simulate_*默认的improved矩阵一致
+        for colorblind_type in colorblind_types:
+            if colorblind_type not in ('protanopia', 'deuteranopia', 'tritanopia'):
+                raise ValueError(f"不支持的色盲类型: {colorblind_type}")
         
-        sim_func = simulation_functions[colorblind_type]
-        generated_files = []
+        img_array = np.asarray(image, dtype=np.float32)
+        original_shape = img_array.shape
+        if len(original_shape) != 3 or original_shape[2] != 3:
+            raise ValueError("图像必须是RGB格式")
         
-        # 生成渐变序列
-        for step in range(num_steps + 1):
-            severity = step / num_steps  # 0.0 到 1.0
-            
-            # 应用色盲模拟
-            simulated_image = sim_func(image, severity)
+        # 所有类型的矩阵拼接为(3, 3*k)，一次GEMM得到(N, 3*k)的完全变换结果
+        pixels = img_array.reshape(-1, 3) / 255.0
+        weights = np.hstack([self._mT[f'improved_{t}'] for t in colorblind_types])
+        
+        use_gpu = _use_gpu(device)
+        if use_gpu:
+            # 上传一次，在设备上完成矩阵乘法
+            pixels = cp.asarray(pixels)
+            all_full = pixels @ cp.asarray(weights)
+        else:
+            all_full = pixels @ weights
+        
+        results = {}
+        for i, colorblind_type in enumerate(colorblind_types):
+            output_path = Path(output_dir)
+            if type_subdirs:
+                output_path = output_path / colorblind_type
+            output_path.mkdir(parents=True, exist_ok=True)
             
-            # 保存图像
-            filename = f"{colorblind_type}_severity_{step:03d}.png"
-            filepath = output_path / filename
-            simulated_image.save(filepath)
+            results[colorblind_type] = self._render_gradients(
+                pixels, all_full[:, i * 3:(i + 1) * 3], original_shape, colorblind_type,
+                num_steps, output_path, output_format, use_gpu
+            )
+        
+        return results
+    
+    def _render_gradients(self, pixels, full, original_shape, colorblind_type,
+                          num_steps, output_path, output_format, use_gpu):
+        """由原图像素和完全变换结果混合出各严重程度的帧并保存"""
+        gpu_frames = None
+        if use_gpu:
+            # 单个内核生成全部帧，只下载最终的uint8结果
+            severities = cp.linspace(0, 1, num_steps + 1, dtype=cp.float32).reshape(-1, 1, 1)
+            gpu_frames = _gradient_kernel()(pixels[None], full[None], severities).get()
+            gpu_frames = gpu_frames.reshape((num_steps + 1,) + original_shape)
+        else:
+            delta = full - pixels
+            out = np.empty_like(pixels)
+        
+        generated_files = []
+        
+        # 打包格式预分配所有帧
+        packed = output_format in ('npz', 'webp')
+        if packed:
+            frames = np.empty((num_steps + 1,) + original_shape, dtype=np.uint8)
+        
+        # 生成渐变序列；编码和写盘交给后台线程，计算不必等待磁盘，
+        # 同时等待保存的帧数有上限，避免所有帧同时驻留内存
+        with FrameWriter(max_workers=4) as writer:
+            for step in range(num_steps + 1):
+                if gpu_frames is not None:
+                    frame = gpu_frames[step]
+                else:
+                    severity = step / num_steps  # 0.0 到 1.0
+                    
+                    # out = pixels + severity * (full - pixels)
+                    np.multiply(delta, severity, out=out)
+                    np.add(out, pixels, out=out)
+                    np.clip(out, 0, 1, out=out)
+                    np.multiply(out, 255, out=out)
+                    np.rint(out, out=out)
+                    frame = out.astype(np.uint8).reshape(original_shape)
+                
+                if packed:
+                    frames[step] = frame
+                    continue
+                
+                # 每一帧都是新的数组，可以安全地交给写线程
+                filename = f"{colorblind_type}_severity_{step:03d}.{output_format}"
+                filepath = output_path / filename
+                writer.save(frame, filepath)
+                generated_files.append(str(filepath))
+        
+        if output_format == 'npz':
+            filepath = output_path / f"{colorblind_type}.npz"
+            np.savez_compressed(filepath, frames=frames)
+            generated_files.append(str(filepath))
+        elif output_format == 'webp':
+            filepath = output_path / f"{colorblind_type}.webp"
+            images = [Image.fromarray(frame) for frame in frames]
+            images[0].save(filepath, save_all=True, append_images=images[1:],
+                           format='WEBP', lossless=False, quality=80)
             generated_files.append(str(filepath))
         
         return generated_files
     
     def analyze_color_contrast(self, image, colorblind_type, severity=1.0):
-        """分析色盲模拟后的颜色对比度"""
+        """分析色盲模拟后的颜色对比度（image可以是PIL Image或uint8数组）"""
         # 模拟色盲
-        sim_functions = {
-            'protanopia': self.simulate_protanopia,
-            'deuteranopia': self.simulate_deuteranopia,
-            'tritanopia': self.simulate_tritanopia
-        }
+        simulated = self.simulate_array(image, colorblind_type, severity)
         
-        simulated_image = sim_functions[colorblind_type](image, severity)
+        analysis = self.analyze_from_arrays(image, simulated)
+        analysis["colorblind_type"] = colorblind_type
+        analysis["severity"] = severity
+        return analysis
+    
+    def analyze_from_arrays(self, original, simulated, original_contrast=None):
+        """由原图和已经模拟好的图像计算颜色和对比度变化，不再重新模拟
         
+        Args:
+            original: 原始图像（PIL Image或uint8数组）
+            simulated: 模拟后的图像（PIL Image或uint8数组）
+            original_contrast: 原图的局部对比度；同一原图多次分析时可传入之前的结果
+        """
         # 转换为numpy数组
-        original = np.array(image, dtype=np.float32) / 255.0
-        simulated = np.array(simulated_image, dtype=np.float32) / 255.0
+        original = np.asarray(original, dtype=np.float32) / 255.0
+        simulated = np.asarray(simulated, dtype=np.float32) / 255.0
         
         # 计算颜色变化
         color_diff = np.mean(np.abs(original - simulated))
         
         # 计算对比度变化
-        original_contrast = self.calculate_local_contrast(original)
+        if original_contrast is None:
+            original_contrast = self.calculate_local_contrast(original)
         simulated_contrast = self.calculate_local_contrast(simulated)
         contrast_change = abs(original_contrast - simulated_contrast)
         
@@ -189,31 +632,37 @@ class ColorBlindnessSimulator:
             "color_difference": float(color_diff),
             "original_contrast": float(original_contrast),
             "simulated_contrast": float(simulated_contrast),
-            "contrast_change": float(contrast_change),
-            "colorblind_type": colorblind_type,
-            "severity": severity
+            "contrast_change": float(contrast_change)
         }
     
     def calculate_local_contrast(self, image_array):
         """计算图像的局部对比度"""
-        # 转换为灰度
+        # 转换为float32灰度
         if len(image_array.shape) == 3:
-            gray = np.mean(image_array, axis=2)
+            gray = image_array.mean(axis=2, dtype=np.float32)
         else:
-            gray = image_array
+            gray = image_array.astype(np.float32, copy=False)
         
-        # 计算梯度
-        grad_x = np.gradient(gray, axis=1)
-        grad_y = np.gradient(gray, axis=0)
+        # 内核的边界差分需要每个方向至少2个像素；更小的图像交给np.gradient（会抛出错误）
+        if NUMBA_AVAILABLE and min(gray.shape) >= 2:
+            return _mean_gradient_magnitude(gray)
         
-        # 计算梯度幅值
-        gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
+        # 计算梯度，并原地计算梯度幅值
+        grad_y, grad_x = np.gradient(gray)
+        np.multiply(grad_x, grad_x, out=grad_x)
+        np.multiply(grad_y, grad_y, out=grad_y)
+        np.add(grad_x, grad_y, out=grad_x)
+        np.sqrt(grad_x, out=grad_x)
         
         # 返回平均对比度
-        return np.mean(gradient_magnitude)
+        return np.mean(grad_x)
     
-    def batch_process_images(self, input_dir, output_dir, colorblind_types=None, num_gradients=100):
-        """批量处理图像"""
+    def batch_process_images(self, input_dir, output_dir, colorblind_types=None, num_gradients=100,
+                             max_workers=None):
+        """批量处理图像（按图像并行到多个进程）
+        
+        工作进程以spawn方式启动，作为脚本调用时需要放在 if __name__ == "__main__": 下。
+        """
         if colorblind_types is None:
             colorblind_types = ['protanopia', 'deuteranopia', 'tritanopia']
         
@@ -221,59 +670,83 @@ class ColorBlindnessSimulator:
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
-        results = []
-        
         # 支持的图像格式
         image_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff'}
         
-        for image_file in input_path.iterdir():
-            if image_file.suffix.lower() in image_extensions:
-                print(f"正在处理: {image_file.name}")
-                
-                try:
-                    # 加载图像
-                    image = Image.open(image_file).convert('RGB')
-                    
-                    # 为每种色盲类型生成渐变
-                    for colorblind_type in colorblind_types:
-                        type_output_dir = output_path / image_file.stem / colorblind_type
-                        type_output_dir.mkdir(parents=True, exist_ok=True)
-                        
-                        # 生成渐变
-                        generated_files = self.generate_gradients(
-                            image, 
-                            colorblind_type, 
-                            num_gradients, 
-                            str(type_output_dir)
-                        )
-                        
-                        # 分析对比度变化
-                        contrast_analysis = self.analyze_color_contrast(
-                            image, colorblind_type, 1.0
-                        )
-                        
-                        results.append({
-                            "original_file": str(image_file),
-                            "colorblind_type": colorblind_type,
-                            "generated_files": generated_files,
-                            "num_gradients": len(generated_files),
-                            "contrast_analysis": contrast_analysis
-                        })
-                        
-                        print(f"  ✓ {colorblind_type}: {len(generated_files)} 个渐变文件")
-                
-                except Exception as e:
-                    print(f"  ✗ 处理失败: {e}")
-        
-        # 保存处理结果
+        tasks = [
+            (str(image_file), list(colorblind_types), num_gradients, str(output_path))
+            for image_file in input_path.iterdir()
+            if image_file.suffix.lower() in image_extensions
+        ]
+        
+        # 结果逐条追加到JSONL，不在内存中累积；中途崩溃或重复运行时已完成的结果不会丢失。
+        # 本进程可能已运行过Numba的并行内核，其线程池在fork出的子进程中不可用（退出时会挂起），
+        # 因此用spawn启动工作进程
+        results_log = output_path / "processing_results.jsonl"
+        with open(results_log, 'ab') as log, \
+                ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                    mp_context=multiprocessing.get_context('spawn')) as executor:
+            for file_results in executor.map(_process_one, tasks, chunksize=1):
+                for result in file_results:
+                    log.write(json_dumps(result) + b'\n')
+                log.flush()
+        
+        # 由JSONL生成汇总文件；同一图像和色盲类型重复处理时以最后一次为准
+        results = read_jsonl(results_log, key=lambda r: (r["original_file"], r["colorblind_type"]))
         results_file = output_path / "processing_results.json"
-        with open(results_file, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        results_file.write_bytes(json_dumps(results, indent=True))
         
         print(f"\n处理完成，结果保存到: {results_file}")
         return results
 
 
+
+def _process_one(args):
+    """处理单个图像的所有色盲类型，供进程池调用"""
+    image_file, colorblind_types, num_gradients, output_dir = args
+    image_file = Path(image_file)
+    print(f"正在处理: {image_file.name}")
+    
+    results = []
+    try:
+        # 每个进程独立构建模拟器，避免序列化
+        simulator = ColorBlindnessSimulator()
+        
+        # 每个文件只解码并转换一次，之后所有色盲类型复用同一数组
+        image = np.asarray(Image.open(image_file).convert('RGB'))
+        
+        # 所有色盲类型共用一次矩阵乘法生成渐变
+        generated = simulator.generate_gradients_multi(
+            image, 
+            colorblind_types, 
+            num_gradients, 
+            str(Path(output_dir) / image_file.stem)
+        )
+        
+        for colorblind_type in colorblind_types:
+            generated_files = generated[colorblind_type]
+            
+            # 分析对比度变化
+            contrast_analysis = simulator.analyze_color_contrast(
+                image, colorblind_type, 1.0
+            )
+            
+            results.append({
+                "original_file": str(image_file),
+                "colorblind_type": colorblind_type,
+                "generated_files": generated_files,
+                "num_gradients": len(generated_files),
+                "contrast_analysis": contrast_analysis
+            })
+            
+            print(f"  ✓ {image_file.name} {colorblind_type}: {len(generated_files)} 个渐变文件")
+    
+    except Exception as e:
+        print(f"  ✗ {image_file.name} 处理失败: {e}")
+    
+    return results
+
+
 class ColorBlindnessMetrics:
     """色盲测试指标计算类"""
     
@@ -281,34 +754,64 @@ class ColorBlindnessMetrics:
         self.simulator = ColorBlindnessSimulator()
     
     def calculate_visibility_threshold(self, image, colorblind_type, target_region=None):
-        """计算可见性阈值 - 在什么严重程度下目标变得不可见"""
-        thresholds = []
+        """计算可见性阈值 - 在什么严重程度下目标变得不可见
         
-        for severity in np.linspace(0, 1, 101):
-            sim_image = getattr(self.simulator, f'simulate_{colorblind_type}')(image, severity)
-            
-            # 计算目标区域的可见性
-            visibility_score = self.calculate_target_visibility(image, sim_image, target_region)
-            
-            if visibility_score < 0.1:  # 阈值可调
-                return severity
+        只对目标区域做一次矩阵变换，之后每个严重程度只需线性混合；
+        可见性判定随严重程度单调，因此在101个严重程度上二分查找。
+        """
+        matrix_t = self.simulator._mT[f'improved_{colorblind_type}']
         
-        return 1.0  # 如果始终可见，返回最大值
+        original = np.asarray(image)
+        if target_region is not None:
+            x1, y1, x2, y2 = target_region
+            original = original[y1:y2, x1:x2]
+            if original.size == 0:
+                raise ValueError(f"目标区域为空或超出图像范围: {target_region}")
+        
+        pixels = original.reshape(-1, 3).astype(np.float32) / 255.0
+        delta = pixels @ matrix_t - pixels
+        
+        def is_invisible(severity):
+            frame = np.clip(pixels + severity * delta, 0, 1) * 255
+            sim_array = np.rint(frame).astype(np.uint8).reshape(original.shape)
+            visibility_score = self.calculate_target_visibility(original, sim_array)
+            return visibility_score < 0.1  # 阈值可调
+        
+        severities = np.linspace(0, 1, 101)
+        if is_invisible(severities[0]):
+            return severities[0]
+        if not is_invisible(severities[-1]):
+            return 1.0  # 如果始终可见，返回最大值
+        
+        # 不变式: severities[low]可见, severities[high]不可见
+        low, high = 0, len(severities) - 1
+        while high - low > 1:
+            mid = (low + high) // 2
+            if is_invisible(severities[mid]):
+                high = mid
+            else:
+                low = mid
+        
+        return severities[high]
     
     def calculate_target_visibility(self, original, simulated, target_region=None):
         """计算目标的可见性得分"""
-        orig_array = np.array(original, dtype=np.float32)
-        sim_array = np.array(simulated, dtype=np.float32)
+        orig_array = np.asarray(original)
+        sim_array = np.asarray(simulated)
         
-        if target_region is None:
-            # 如果没有指定目标区域，计算整体差异
-            diff = np.mean(np.abs(orig_array - sim_array))
-        else:
-            # 计算指定区域的差异
+        if target_region is not None:
+            # 先切片指定区域，只处理区域内的像素
             x1, y1, x2, y2 = target_region
-            orig_region = orig_array[y1:y2, x1:x2]
-            sim_region = sim_array[y1:y2, x1:x2]
-            diff = np.mean(np.abs(orig_region - sim_region))
+            orig_array = orig_array[y1:y2, x1:x2]
+            sim_array = sim_array[y1:y2, x1:x2]
+        
+        if NUMBA_AVAILABLE and orig_array.dtype == np.uint8 and sim_array.dtype == np.uint8:
+            diff = _mean_abs_diff_u8(orig_array.reshape(-1), sim_array.reshape(-1))
+        elif orig_array.dtype == np.uint8 and sim_array.dtype == np.uint8:
+            diff_array = np.subtract(orig_array, sim_array, dtype=np.int16)
+            diff = np.mean(np.abs(diff_array, out=diff_array))
+        else:
+            diff = np.mean(np.abs(orig_array.astype(np.float32) - sim_array))
         
         return diff / 255.0  # 标准化到0-1范围
 
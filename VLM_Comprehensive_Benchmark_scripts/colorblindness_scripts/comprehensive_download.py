@@ -7,25 +7,109 @@ import requests
 import json
 import time
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import urllib3
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin, urlparse, quote
 # from bs4 import BeautifulSoup  # 暂时注释掉，不是必需的
 
+from io_utils import json_dumps, read_jsonl, save_stream
+
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class ComprehensiveIshiharaDownloader:
-    def __init__(self, base_dir="data/raw"):
+    def __init__(self, base_dir="data/raw", metadata_file="metadata/comprehensive_download_metadata.json"):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
-        self.metadata = []
+        
+        # 元数据逐条追加到JSONL，内存中只保留计数；中途崩溃或重新运行都不会丢失已下载记录
+        self.metadata_file = Path(metadata_file)
+        self.metadata_log = self.metadata_file.with_suffix('.jsonl')
+        self.metadata_log.parent.mkdir(parents=True, exist_ok=True)
+        self.metadata_count = 0
         
         self.session = requests.Session()
         self.session.verify = False
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        
+        # 扩大连接池，复用TCP/TLS连接
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url, filepath, timeout=(10, 30)):
+        """单次GET探测并流式写入磁盘（替代HEAD+GET两次往返）
+        
+        Returns:
+            写入的文件大小；非200时返回None
+        """
+        with self.session.get(url, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            return save_stream(response, filepath)
+
+    def record_metadata(self, entry):
+        """追加一条元数据到JSONL日志"""
+        with open(self.metadata_log, 'ab') as f:
+            f.write(json_dumps(entry) + b'\n')
+        self.metadata_count += 1
+
+    def probe_and_download(self, tasks, max_workers=32, per_host=4):
+        """并发探测候选URL并保存命中的图像
+        
+        Args:
+            tasks: [(url, name_func, entry), ...]；name_func(序号)返回文件名，
+                entry为写入元数据的其余字段
+            max_workers: 线程数
+            per_host: 每个主机的最大并发请求数
+        
+        Returns:
+            下载成功的图像数量
+        """
+        host_limits = {
+            host: threading.Semaphore(per_host)
+            for host in {urlparse(url).netloc for url, _, _ in tasks}
+        }
+        
+        def probe(indexed_task):
+            index, (url, _, _) = indexed_task
+            # 先写入临时文件，命中后在主线程中按序号重命名
+            part_path = self.base_dir / f".probe_{index}.part"
+            with host_limits[urlparse(url).netloc]:
+                try:
+                    return indexed_task, part_path, self.fetch(url, part_path)
+                except Exception:
+                    # 忽略404、超时等错误，继续尝试下一个
+                    return indexed_task, part_path, None
+        
+        downloaded = 0
+        
+        # 结果按提交顺序在主线程中处理，文件编号与顺序下载一致
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for (_, (url, name_func, entry)), part_path, file_size in executor.map(probe, enumerate(tasks)):
+                if file_size is None:
+                    continue
+                
+                filename = name_func(downloaded + 1)
+                part_path.replace(self.base_dir / filename)
+                
+                self.record_metadata({
+                    "filename": filename,
+                    "source": entry["source"],
+                    "url": url,
+                    "type": entry["type"],
+                    "file_size": file_size
+                })
+                
+                downloaded += 1
+                print(f"    ✓ 下载成功: {filename}")
+        
+        return downloaded
 
     def download_from_online_test_sites(self):
         """从在线测试网站下载图像"""
@@ -60,44 +144,23 @@ class ComprehensiveIshiharaDownloader:
             }
         ]
         
-        downloaded = 0
+        tasks = []
         
         for site in test_sites:
             print(f"  尝试从 {site['name']} 下载...")
+            site_key = site['name'].lower().replace('.', '_')
+            entry = {
+                "source": f"Online Test Site - {site['name']}",
+                "type": "ishihara_online"
+            }
             
             for pattern in site['image_patterns']:
                 for i in range(1, 40):  # 尝试1-39号图像
                     url = site['base_url'] + pattern.format(i)
-                    
-                    try:
-                        response = self.session.head(url, timeout=10)
-                        if response.status_code == 200:
-                            # 找到了图像，下载它
-                            response = self.session.get(url, timeout=30)
-                            if response.status_code == 200:
-                                filename = f"online_{site['name'].lower().replace('.', '_')}_{i:02d}.jpg"
-                                filepath = self.base_dir / filename
-                                
-                                with open(filepath, 'wb') as f:
-                                    f.write(response.content)
-                                
-                                self.metadata.append({
-                                    "filename": filename,
-                                    "source": f"Online Test Site - {site['name']}",
-                                    "url": url,
-                                    "type": "ishihara_online",
-                                    "file_size": len(response.content)
-                                })
-                                
-                                downloaded += 1
-                                print(f"    ✓ 下载成功: {filename}")
-                                time.sleep(0.5)
-                                
-                    except Exception as e:
-                        # 忽略404等错误，继续尝试下一个
-                        pass
+                    name_func = lambda n, site_key=site_key, i=i: f"online_{site_key}_{i:02d}.jpg"
+                    tasks.append((url, name_func, entry))
         
-        return downloaded
+        return self.probe_and_download(tasks)
 
     def download_from_educational_sites(self):
         """从教育网站下载"""
@@ -110,61 +173,37 @@ class ComprehensiveIshiharaDownloader:
             "https://www.college-optometrists.org",  # College of Optometrists
         ]
         
-        downloaded = 0
+        # 尝试常见的图像路径
+        common_paths = [
+            "/images/color-vision/",
+            "/resources/images/",
+            "/media/images/",
+            "/assets/images/",
+            "/files/images/"
+        ]
+        
+        tasks = []
         
         for base_url in edu_sites:
-            try:
-                print(f"  搜索 {base_url}...")
-                
-                # 尝试常见的图像路径
-                common_paths = [
-                    "/images/color-vision/",
-                    "/resources/images/",
-                    "/media/images/",
-                    "/assets/images/",
-                    "/files/images/"
-                ]
-                
-                for path in common_paths:
-                    for i in range(1, 20):
-                        test_urls = [
-                            f"{base_url}{path}ishihara-{i}.jpg",
-                            f"{base_url}{path}plate-{i}.png",
-                            f"{base_url}{path}colortest-{i}.jpg"
-                        ]
-                        
-                        for url in test_urls:
-                            try:
-                                response = self.session.head(url, timeout=10)
-                                if response.status_code == 200:
-                                    response = self.session.get(url, timeout=30)
-                                    if response.status_code == 200:
-                                        domain = urlparse(base_url).netloc
-                                        filename = f"edu_{domain.replace('.', '_')}_{downloaded+1:02d}.jpg"
-                                        filepath = self.base_dir / filename
-                                        
-                                        with open(filepath, 'wb') as f:
-                                            f.write(response.content)
-                                        
-                                        self.metadata.append({
-                                            "filename": filename,
-                                            "source": f"Educational Site - {domain}",
-                                            "url": url,
-                                            "type": "ishihara_educational",
-                                            "file_size": len(response.content)
-                                        })
-                                        
-                                        downloaded += 1
-                                        print(f"    ✓ 下载成功: {filename}")
-                                        time.sleep(1)
-                                        
-                            except Exception:
-                                pass
-                                
-            except Exception as e:
-                print(f"  ✗ 访问失败 {base_url}: {e}")
+            print(f"  搜索 {base_url}...")
+            domain = urlparse(base_url).netloc
+            domain_key = domain.replace('.', '_')
+            name_func = lambda n, domain_key=domain_key: f"edu_{domain_key}_{n:02d}.jpg"
+            entry = {
+                "source": f"Educational Site - {domain}",
+                "type": "ishihara_educational"
+            }
+            
+            for path in common_paths:
+                for i in range(1, 20):
+                    test_urls = [
+                        f"{base_url}{path}ishihara-{i}.jpg",
+                        f"{base_url}{path}plate-{i}.png",
+                        f"{base_url}{path}colortest-{i}.jpg"
+                    ]
+                    tasks.extend((url, name_func, entry) for url in test_urls)
         
-        return downloaded
+        return self.probe_and_download(tasks)
 
     def download_from_medical_archives(self):
         """从医学档案和数据库下载"""
@@ -178,61 +217,37 @@ class ComprehensiveIshiharaDownloader:
             "https://www.mayoclinic.org"
         ]
         
-        downloaded = 0
+        # 常见的医学图像路径
+        medical_paths = [
+            "/images/medical/",
+            "/media/medical-images/",
+            "/assets/health-images/",
+            "/images/conditions/",
+            "/media/eye-health/"
+        ]
+        
+        tasks = []
         
         for base_url in medical_sources:
-            try:
-                print(f"  搜索 {base_url}...")
-                
-                # 常见的医学图像路径
-                medical_paths = [
-                    "/images/medical/",
-                    "/media/medical-images/",
-                    "/assets/health-images/",
-                    "/images/conditions/",
-                    "/media/eye-health/"
-                ]
-                
-                for path in medical_paths:
-                    for i in range(1, 15):
-                        test_urls = [
-                            f"{base_url}{path}color-vision-test-{i}.jpg",
-                            f"{base_url}{path}ishihara-test-{i}.png",
-                            f"{base_url}{path}eye-test-{i}.jpg"
-                        ]
-                        
-                        for url in test_urls:
-                            try:
-                                response = self.session.head(url, timeout=10)
-                                if response.status_code == 200:
-                                    response = self.session.get(url, timeout=30)
-                                    if response.status_code == 200:
-                                        domain = urlparse(base_url).netloc
-                                        filename = f"medical_{domain.replace('.', '_')}_{downloaded+1:02d}.jpg"
-                                        filepath = self.base_dir / filename
-                                        
-                                        with open(filepath, 'wb') as f:
-                                            f.write(response.content)
-                                        
-                                        self.metadata.append({
-                                            "filename": filename,
-                                            "source": f"Medical Archive - {domain}",
-                                            "url": url,
-                                            "type": "ishihara_medical",
-                                            "file_size": len(response.content)
-                                        })
-                                        
-                                        downloaded += 1
-                                        print(f"    ✓ 下载成功: {filename}")
-                                        time.sleep(1)
-                                        
-                            except Exception:
-                                pass
-                                
-            except Exception as e:
-                print(f"  ✗ 访问失败 {base_url}: {e}")
+            print(f"  搜索 {base_url}...")
+            domain = urlparse(base_url).netloc
+            domain_key = domain.replace('.', '_')
+            name_func = lambda n, domain_key=domain_key: f"medical_{domain_key}_{n:02d}.jpg"
+            entry = {
+                "source": f"Medical Archive - {domain}",
+                "type": "ishihara_medical"
+            }
+            
+            for path in medical_paths:
+                for i in range(1, 15):
+                    test_urls = [
+                        f"{base_url}{path}color-vision-test-{i}.jpg",
+                        f"{base_url}{path}ishihara-test-{i}.png",
+                        f"{base_url}{path}eye-test-{i}.jpg"
+                    ]
+                    tasks.extend((url, name_func, entry) for url in test_urls)
         
-        return downloaded
+        return self.probe_and_download(tasks)
 
     def download_from_google_images_api(self):
         """尝试从搜索结果中获取图像链接"""
@@ -280,20 +295,16 @@ class ComprehensiveIshiharaDownloader:
         
         for url in alternative_urls:
             try:
-                response = self.session.get(url, timeout=30)
-                if response.status_code == 200:
-                    filename = f"alternative_{downloaded+1:02d}.jpg"
-                    filepath = self.base_dir / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    self.metadata.append({
+                filename = f"alternative_{downloaded+1:02d}.jpg"
+                filepath = self.base_dir / filename
+                file_size = self.fetch(url, filepath, timeout=30)
+                if file_size is not None:
+                    self.record_metadata({
                         "filename": filename,
                         "source": "Alternative Source",
                         "url": url,
                         "type": "ishihara_alternative",
-                        "file_size": len(response.content)
+                        "file_size": file_size
                     })
                     
                     downloaded += 1
@@ -305,17 +316,20 @@ class ComprehensiveIshiharaDownloader:
         
         return downloaded
 
-    def save_metadata(self, metadata_file="metadata/comprehensive_download_metadata.json"):
-        """保存元数据"""
-        metadata_path = Path(metadata_file)
+    def save_metadata(self, metadata_file=None):
+        """由JSONL日志生成完整的元数据文件"""
+        metadata_path = Path(metadata_file) if metadata_file else self.metadata_file
         metadata_path.parent.mkdir(parents=True, exist_ok=True)
         
+        # 重新运行会覆盖同名文件，同一文件名以最后一条记录为准
+        images = read_jsonl(self.metadata_log, key=lambda entry: entry["filename"])
+        
         with open(metadata_path, 'w', encoding='utf-8') as f:
             json.dump({
-                "total_images": len(self.metadata),
+                "total_images": len(images),
                 "download_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
                 "source": "Comprehensive Download",
-                "images": self.metadata
+                "images": images
             }, f, indent=2, ensure_ascii=False)
         
         print(f"✓ 元数据保存到: {metadata_path}")
@@ -343,7 +357,7 @@ class ComprehensiveIshiharaDownloader:
                 print(f"从 {method_name} 下载了 {downloaded} 张图像")
                 
                 # 如果已经达到目标，可以提前结束
-                if len(self.metadata) >= 100:
+                if self.metadata_count >= 100:
                     print("已达到目标数量，停止下载")
                     break
                     
@@ -354,7 +368,7 @@ class ComprehensiveIshiharaDownloader:
         self.save_metadata()
         
         print(f"\n=== 综合下载完成 ===")
-        print(f"新下载: {len(self.metadata)} 张图像")
+        print(f"新下载: {self.metadata_count} 张图像")
         
         # 统计总数（包括之前下载的）
         total_files = len(list(self.base_dir.glob("*.png"))) + len(list(self.base_dir.glob("*.jpg")))
@@ -366,7 +380,7 @@ class ComprehensiveIshiharaDownloader:
         else:
             print(f"还需要: {100 - total_files} 张图像")
         
-        return len(self.metadata)
+        return self.metadata_count
 
 
 if __name__ == "__main__":
@@ -3,296 +3,402 @@
 从GitHub仓库下载色盲测试图像
 """
 
+import hashlib
 import requests
-import json
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-import urllib3
+from urllib.parse import quote, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from io_utils import json_dumps, json_loads, save_stream
+
+# 并发下载的最大请求数
+MAX_CONCURRENT_DOWNLOADS = 16
+
+# 超过此大小的文件不是测试图（石原氏测试图通常小于500KB），不下载
+MAX_FILE_BYTES = 4 * 1024 * 1024
+
+# 要下载的GitHub仓库：(名称, 仓库URL, 文件名前缀, 来源, 图像类型, 候选目录, 最大文件数)
+REPOSITORIES = [
+    # 石原氏标准测试图有38张
+    ("ishihara-plate-learning", "https://github.com/DJakarta/ishihara-plate-learning",
+     "github_learning", "GitHub ishihara-plate-learning", "ishihara_real",
+     ['imgs', 'images', 'plates', 'assets', 'src'], 38),
+    # Monte Carlo生成的图像
+    ("IshiharaMC", "https://github.com/icfaust/IshiharaMC",
+     "github_mc", "GitHub IshiharaMC", "ishihara_monte_carlo",
+     ['', 'images', 'examples', 'output'], None),
+    ("Color_Blindness_Toolkit", "https://github.com/bhav09/Color_Blindness_Toolkit",
+     "github_toolkit", "GitHub Color_Blindness_Toolkit", "ishihara_toolkit",
+     ['', 'images', 'data', 'assets', 'samples'], None),
+    # R包的示例图像
+    ("njtierney/ishihara", "https://github.com/njtierney/ishihara",
+     "github_r", "GitHub njtierney/ishihara", "ishihara_r_generated",
+     ['', 'inst', 'examples', 'man/figures', 'vignettes'], None),
+]
+
+# 默认下载的图像扩展名（不含点，小写）
+IMAGE_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'bmp', 'gif'})
+
+
+def _extension_set(target_extensions):
+    """将扩展名集合规范为不含点的小写frozenset"""
+    if target_extensions is None:
+        return IMAGE_EXTENSIONS
+    return frozenset(ext.lstrip('.').lower() for ext in target_extensions)
+
+
+def _has_extension(name, extensions):
+    """判断文件名的扩展名是否在集合中，不构造Path对象"""
+    dot = name.rfind('.')
+    return dot >= 0 and name[dot + 1:].lower() in extensions
 
-# 禁用SSL警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class GitHubIshiharaDownloader:
-    def __init__(self, base_dir="data/raw"):
+    def __init__(self, base_dir="data/raw", cache_dir=".cache/github", cache_ttl=86400,
+                 metadata_file="metadata/github_images_metadata.json"):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
-        self.metadata = []
+        self.metadata_lock = threading.Lock()
+        
+        # 每下载一个文件就追加一行到JSONL日志，中断后重新运行可以续传
+        self.metadata_file = Path(metadata_file)
+        self.metadata_log = self.metadata_file.with_suffix('.jsonl')
+        self.metadata_log.parent.mkdir(parents=True, exist_ok=True)
+        records = self.load_metadata_log()
+        self.metadata = [record for record in records if 'duplicate_of' not in record]
+        
+        # 已下载的URL和内容哈希：前者跳过整个请求（包括内容重复而被丢弃的URL），后者用于跨仓库去重
+        self.seen_urls = {record['url'] for record in records}
+        self.seen_hashes = {record['sha256'] for record in self.metadata if record.get('sha256')}
+        
+        # GitHub API响应的磁盘缓存，避免重复运行时耗尽未认证的速率限制
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_ttl = cache_ttl
         
         self.session = requests.Session()
-        self.session.verify = False
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
+        
+        # 设置GITHUB_TOKEN后速率限制从60次/小时提升到5000次/小时
+        token = os.environ.get('GITHUB_TOKEN')
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+            self.session.headers['Accept'] = 'application/vnd.github+json'
+        
+        # 各仓库在不同线程中并发下载，同一主机的并发请求数由共享的信号量限制在
+        # MAX_CONCURRENT_DOWNLOADS以内，不随仓库数增长
+        self.host_semaphores = {}
+        self.host_lock = threading.Lock()
+        
+        # api.github.com 和 raw.githubusercontent.com 复用keep-alive连接，
+        # 每个主机的连接池大小覆盖该主机的并发请求数；5xx瞬时错误由urllib3按指数退避重试，
+        # 429限流交给get_with_backoff按Retry-After处理
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=MAX_CONCURRENT_DOWNLOADS,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=['GET']
+            )
+        )
+        self.session.mount('https://', adapter)
 
-    def get_github_repo_files(self, repo_url, target_extensions=None):
-        """获取GitHub仓库中的文件列表"""
-        if target_extensions is None:
-            target_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
-        
-        # 将GitHub页面URL转换为API URL
-        if 'github.com' in repo_url:
-            parts = repo_url.replace('https://github.com/', '').split('/')
-            if len(parts) >= 2:
-                owner, repo = parts[0], parts[1]
-                api_url = f"https://api.github.com/repos/{owner}/{repo}/contents"
-                
-                try:
-                    response = self.session.get(api_url, timeout=30)
-                    if response.status_code == 200:
-                        files = response.json()
-                        image_files = []
-                        
-                        for file_info in files:
-                            if file_info['type'] == 'file':
-                                file_name = file_info['name']
-                                file_ext = Path(file_name).suffix.lower()
-                                if file_ext in target_extensions:
-                                    image_files.append({
-                                        'name': file_name,
-                                        'download_url': file_info['download_url'],
-                                        'size': file_info['size']
-                                    })
-                        
-                        return image_files
-                        
-                except Exception as e:
-                    print(f"获取仓库文件列表失败: {e}")
-                    
-        return []
+    def host_semaphore(self, url):
+        """获取URL所在主机的信号量（所有仓库线程共享）"""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+            return self.host_semaphores[host]
 
-    def get_github_subdirectory_files(self, repo_url, subdirectory, target_extensions=None):
-        """获取GitHub仓库子目录中的文件"""
-        if target_extensions is None:
-            target_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
-        
-        if 'github.com' in repo_url:
-            parts = repo_url.replace('https://github.com/', '').split('/')
-            if len(parts) >= 2:
-                owner, repo = parts[0], parts[1]
-                api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{subdirectory}"
-                
-                try:
-                    response = self.session.get(api_url, timeout=30)
-                    if response.status_code == 200:
-                        files = response.json()
-                        image_files = []
-                        
-                        for file_info in files:
-                            if file_info['type'] == 'file':
-                                file_name = file_info['name']
-                                file_ext = Path(file_name).suffix.lower()
-                                if file_ext in target_extensions:
-                                    image_files.append({
-                                        'name': file_name,
-                                        'download_url': file_info['download_url'],
-                                        'size': file_info['size'],
-                                        'path': file_info['path']
-                                    })
-                        
-                        return image_files
-                        
-                except Exception as e:
-                    print(f"获取子目录文件列表失败: {e}")
-                    
-        return []
+    def load_metadata_log(self):
+        """读取之前运行写入的JSONL元数据日志"""
+        if not self.metadata_log.exists():
+            return []
+        with open(self.metadata_log, 'rb') as f:
+            return [json_loads(line) for line in f if line.strip()]
+
+    def record_metadata(self, record):
+        """追加一条元数据到JSONL日志（调用方需持有metadata_lock）"""
+        with open(self.metadata_log, 'ab') as f:
+            f.write(json_dumps(record) + b'\n')
+        self.metadata.append(record)
 
-    def download_from_ishihara_plate_learning(self):
-        """从ishihara-plate-learning仓库下载图像"""
-        print("正在从ishihara-plate-learning仓库下载...")
+    def record_duplicate(self, url, sha256):
+        """追加一条内容重复的URL到JSONL日志，重新运行时不再下载（调用方需持有metadata_lock）
         
-        repo_url = "https://github.com/DJakarta/ishihara-plate-learning"
-        downloaded = 0
+        duplicate_of为已保存的相同内容的SHA-256；这类记录不计入图像元数据。
+        """
+        with open(self.metadata_log, 'ab') as f:
+            f.write(json_dumps({"url": url, "duplicate_of": sha256}) + b'\n')
+        self.seen_urls.add(url)
+
+    def wait_for_rate_limit(self, response, min_remaining=5):
+        """剩余API配额不足时，等待到速率限制重置"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None or int(remaining) >= min_remaining:
+            return
         
-        # 尝试从可能的图像目录下载
-        possible_dirs = ['imgs', 'images', 'plates', 'assets', 'src']
+        delay = max(0, int(reset) - time.time())
+        print(f"  GitHub API剩余配额 {remaining}，等待 {delay:.0f} 秒至限制重置...")
+        time.sleep(delay)
+
+    def get_with_backoff(self, url, max_attempts=5, **kwargs):
+        """GET请求；被限流时按服务器给出的时间等待后重试
         
-        for dir_name in possible_dirs:
-            files = self.get_github_subdirectory_files(repo_url, dir_name)
-            if files:
-                print(f"  在 {dir_name} 目录发现 {len(files)} 个图像文件")
-                
-                for file_info in files:
-                    if downloaded >= 38:  # 石原氏标准测试图有38张
-                        break
-                        
-                    try:
-                        response = self.session.get(file_info['download_url'], timeout=30)
-                        if response.status_code == 200:
-                            filename = f"github_learning_{downloaded+1:02d}_{file_info['name']}"
-                            filepath = self.base_dir / filename
-                            
-                            with open(filepath, 'wb') as f:
-                                f.write(response.content)
-                            
-                            self.metadata.append({
-                                "filename": filename,
-                                "source": "GitHub ishihara-plate-learning",
-                                "url": file_info['download_url'],
-                                "original_name": file_info['name'],
-                                "type": "ishihara_real",
-                                "file_size": len(response.content)
-                            })
-                            
-                            downloaded += 1
-                            print(f"  ✓ 下载成功: {filename}")
-                            time.sleep(0.5)
-                            
-                    except Exception as e:
-                        print(f"  ✗ 下载失败 {file_info['name']}: {e}")
+        正常响应立即返回，不做任何固定等待；5xx错误由连接池的Retry负责重试。
+        """
+        for attempt in range(max_attempts):
+            response = self.session.get(url, **kwargs)
+            if response.status_code not in (403, 429):
+                return response
+            
+            if response.headers.get('Retry-After'):
+                delay = float(response.headers['Retry-After'])
+            elif response.headers.get('X-RateLimit-Remaining') == '0':
+                delay = max(0, int(response.headers.get('X-RateLimit-Reset', 0)) - time.time())
+            elif response.status_code == 429:
+                delay = min(60, 0.5 * 2 ** attempt)
+            else:
+                # 与速率限制无关的403
+                return response
+            
+            if attempt == max_attempts - 1:
+                return response
+            response.close()
+            print(f"  请求被限流，{delay:.0f} 秒后重试: {url}")
+            time.sleep(delay)
         
-        return downloaded
+        return response
 
-    def download_from_icfaust_ishihara(self):
-        """从IshiharaMC仓库下载Monte Carlo生成的图像"""
-        print("正在从IshiharaMC仓库下载...")
+    def get_api_json(self, api_url):
+        """获取GitHub API的JSON响应，带磁盘缓存和ETag重新验证
         
-        repo_url = "https://github.com/icfaust/IshiharaMC"
-        downloaded = 0
+        Returns:
+            解析后的JSON；404或其他失败响应返回None
+        """
+        cache_path = self.cache_dir / f"{hashlib.sha256(api_url.encode('utf-8')).hexdigest()}.json"
+        cached = None
+        if cache_path.exists():
+            cached = json_loads(cache_path.read_bytes())
+            if time.time() - cached['timestamp'] < self.cache_ttl:
+                return cached['data']
         
-        # 检查根目录和可能的子目录
-        possible_dirs = ['', 'images', 'examples', 'output']
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
         
-        for dir_name in possible_dirs:
-            if dir_name:
-                files = self.get_github_subdirectory_files(repo_url, dir_name)
-            else:
-                files = self.get_github_repo_files(repo_url)
-                
-            if files:
-                print(f"  在 {dir_name or '根目录'} 发现 {len(files)} 个图像文件")
-                
-                for file_info in files:
-                    try:
-                        response = self.session.get(file_info['download_url'], timeout=30)
-                        if response.status_code == 200:
-                            filename = f"github_mc_{downloaded+1:02d}_{file_info['name']}"
-                            filepath = self.base_dir / filename
-                            
-                            with open(filepath, 'wb') as f:
-                                f.write(response.content)
-                            
-                            self.metadata.append({
-                                "filename": filename,
-                                "source": "GitHub IshiharaMC",
-                                "url": file_info['download_url'],
-                                "original_name": file_info['name'],
-                                "type": "ishihara_monte_carlo",
-                                "file_size": len(response.content)
-                            })
-                            
-                            downloaded += 1
-                            print(f"  ✓ 下载成功: {filename}")
-                            time.sleep(0.5)
-                            
-                    except Exception as e:
-                        print(f"  ✗ 下载失败 {file_info['name']}: {e}")
+        response = self.get_with_backoff(api_url, timeout=30, headers=headers)
+        self.wait_for_rate_limit(response)
+        if response.status_code == 304 and cached:
+            # 内容未变化，只刷新缓存时间
+            data = cached['data']
+        elif response.status_code == 200:
+            data = json_loads(response.content)
+        elif response.status_code == 404:
+            # 不存在的候选目录同样缓存，重复运行时不再消耗请求配额
+            data = None
+        else:
+            return None
         
-        return downloaded
+        cache_path.write_bytes(json_dumps({
+            "url": api_url,
+            "timestamp": time.time(),
+            "etag": response.headers.get('ETag') or (cached or {}).get('etag'),
+            "data": data
+        }))
+        
+        return data
 
-    def download_from_color_blindness_toolkit(self):
-        """从Color_Blindness_Toolkit仓库下载"""
-        print("正在从Color_Blindness_Toolkit仓库下载...")
+    def get_github_repo_tree(self, repo_url, directories, target_extensions=None):
+        """通过Git Trees API一次性列出仓库中指定目录下的图像文件
         
-        repo_url = "https://github.com/bhav09/Color_Blindness_Toolkit"
-        downloaded = 0
+        Args:
+            repo_url: GitHub仓库页面URL
+            directories: 候选目录列表，''表示根目录；只返回这些目录的直接子文件
+            target_extensions: 目标扩展名集合
         
-        possible_dirs = ['', 'images', 'data', 'assets', 'samples']
+        Returns:
+            文件信息列表，按directories的顺序排列
+        """
+        target_exts = _extension_set(target_extensions)
         
-        for dir_name in possible_dirs:
-            if dir_name:
-                files = self.get_github_subdirectory_files(repo_url, dir_name)
-            else:
-                files = self.get_github_repo_files(repo_url)
-                
-            if files:
-                print(f"  在 {dir_name or '根目录'} 发现 {len(files)} 个图像文件")
-                
-                for file_info in files:
-                    try:
-                        response = self.session.get(file_info['download_url'], timeout=30)
-                        if response.status_code == 200:
-                            filename = f"github_toolkit_{downloaded+1:02d}_{file_info['name']}"
-                            filepath = self.base_dir / filename
-                            
-                            with open(filepath, 'wb') as f:
-                                f.write(response.content)
-                            
-                            self.metadata.append({
-                                "filename": filename,
-                                "source": "GitHub Color_Blindness_Toolkit",
-                                "url": file_info['download_url'],
-                                "original_name": file_info['name'],
-                                "type": "ishihara_toolkit",
-                                "file_size": len(response.content)
-                            })
-                            
-                            downloaded += 1
-                            print(f"  ✓ 下载成功: {filename}")
-                            time.sleep(0.5)
-                            
-                    except Exception as e:
-                        print(f"  ✗ 下载失败 {file_info['name']}: {e}")
+        parts = repo_url.replace('https://github.com/', '').split('/')
+        if 'github.com' not in repo_url or len(parts) < 2:
+            return []
+        owner, repo = parts[0], parts[1]
         
-        return downloaded
+        try:
+            repo_info = self.get_api_json(f"https://api.github.com/repos/{owner}/{repo}")
+            if repo_info is None:
+                return []
+            branch = repo_info['default_branch']
+            tree = self.get_api_json(
+                f"https://api.github.com/repos/{owner}/{repo}/git/trees/{quote(branch)}?recursive=1"
+            )
+            if tree is None:
+                return []
+        except Exception as e:
+            print(f"获取仓库文件树失败: {e}")
+            return []
+        
+        files_by_dir = {directory: [] for directory in directories}
+        for item in tree['tree']:
+            if item['type'] != 'blob':
+                continue
+            directory, _, name = item['path'].rpartition('/')
+            if directory in files_by_dir and _has_extension(name, target_exts):
+                files_by_dir[directory].append({
+                    'name': name,
+                    'download_url': f"https://raw.githubusercontent.com/{owner}/{repo}/{quote(branch)}/{quote(item['path'])}",
+                    'size': item.get('size', 0),
+                    'path': item['path']
+                })
+        
+        image_files = []
+        for directory in directories:
+            if files_by_dir[directory]:
+                print(f"  在 {directory or '根目录'} 发现 {len(files_by_dir[directory])} 个图像文件")
+                image_files.extend(files_by_dir[directory])
+        
+        return image_files
 
-    def download_from_njtierney_ishihara(self):
-        """从njtierney/ishihara R包仓库下载示例图像"""
-        print("正在从njtierney/ishihara仓库下载...")
+    def stream_to_file(self, url, filepath):
+        """流式下载到文件，同时计算SHA-256
         
-        repo_url = "https://github.com/njtierney/ishihara"
-        downloaded = 0
+        Returns:
+            (写入的字节数, 十六进制摘要)；非200时返回None
+        """
+        with self.get_with_backoff(url, timeout=30, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            digest = hashlib.sha256()
+            size = save_stream(response, filepath, digest=digest)
+        return size, digest.hexdigest()
+
+    def download_files(self, files, prefix, source, image_type, start_index=0):
+        """并发下载一组文件，按列表顺序编号保存
         
-        possible_dirs = ['', 'inst', 'examples', 'man/figures', 'vignettes']
+        Args:
+            files: get_github_repo_tree返回的文件信息列表
+            prefix: 文件名前缀，如 "github_learning"
+            source: 元数据中的来源描述
+            image_type: 元数据中的图像类型
+            start_index: 已下载数量，用于续接文件编号
         
-        for dir_name in possible_dirs:
-            if dir_name:
-                files = self.get_github_subdirectory_files(repo_url, dir_name)
-            else:
-                files = self.get_github_repo_files(repo_url)
+        Returns:
+            成功下载的数量
+        """
+        def fetch(indexed_file):
+            index, file_info = indexed_file
+            url = file_info['download_url']
+            # 先写入临时文件，编号确定后再重命名
+            part_path = self.base_dir / f".{prefix}_{index}.part"
+            with self.host_semaphore(url):
+                try:
+                    return file_info, part_path, self.stream_to_file(url, part_path), None
+                except Exception as e:
+                    part_path.unlink(missing_ok=True)
+                    return file_info, part_path, None, e
+        
+        downloaded = 0
+        
+        # 结果按提交顺序在当前线程中处理，文件编号与顺序下载一致
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+            for file_info, part_path, result, error in executor.map(fetch, enumerate(files)):
+                if error is not None:
+                    print(f"  ✗ 下载失败 {file_info['name']}: {error}")
+                    continue
+                if result is None:
+                    continue
                 
-            if files:
-                print(f"  在 {dir_name or '根目录'} 发现 {len(files)} 个图像文件")
+                size, sha256 = result
+                with self.metadata_lock:
+                    duplicate = sha256 in self.seen_hashes
+                    self.seen_hashes.add(sha256)
+                    if duplicate:
+                        self.record_duplicate(file_info['download_url'], sha256)
+                if duplicate:
+                    # 相同内容已从其他仓库或上次运行中获得
+                    part_path.unlink()
+                    print(f"  - 跳过重复文件: {file_info['name']}")
+                    continue
                 
-                for file_info in files:
-                    try:
-                        response = self.session.get(file_info['download_url'], timeout=30)
-                        if response.status_code == 200:
-                            filename = f"github_r_{downloaded+1:02d}_{file_info['name']}"
-                            filepath = self.base_dir / filename
-                            
-                            with open(filepath, 'wb') as f:
-                                f.write(response.content)
-                            
-                            self.metadata.append({
-                                "filename": filename,
-                                "source": "GitHub njtierney/ishihara",
-                                "url": file_info['download_url'],
-                                "original_name": file_info['name'],
-                                "type": "ishihara_r_generated",
-                                "file_size": len(response.content)
-                            })
-                            
-                            downloaded += 1
-                            print(f"  ✓ 下载成功: {filename}")
-                            time.sleep(0.5)
-                            
-                    except Exception as e:
-                        print(f"  ✗ 下载失败 {file_info['name']}: {e}")
+                filename = f"{prefix}_{start_index+downloaded+1:02d}_{file_info['name']}"
+                part_path.replace(self.base_dir / filename)
+                
+                # 各仓库在不同线程中下载，日志在锁内追加
+                with self.metadata_lock:
+                    self.record_metadata({
+                        "filename": filename,
+                        "source": source,
+                        "url": file_info['download_url'],
+                        "original_name": file_info['name'],
+                        "type": image_type,
+                        "file_size": size,
+                        "sha256": sha256
+                    })
+                
+                downloaded += 1
+                print(f"  ✓ 下载成功: {filename}")
         
         return downloaded
 
-    def save_metadata(self, metadata_file="metadata/github_images_metadata.json"):
-        """保存元数据"""
-        metadata_path = Path(metadata_file)
+    def _download_repo(self, repo_url, prefix, source, image_type, possible_dirs, max_files=None):
+        """从一个GitHub仓库的候选目录下载图像
+        
+        Args:
+            repo_url: GitHub仓库页面URL
+            prefix: 文件名前缀
+            source: 元数据中的来源描述
+            image_type: 元数据中的图像类型
+            possible_dirs: 候选图像目录，''表示根目录
+            max_files: 最多下载的文件数，None表示不限
+        
+        Returns:
+            成功下载的数量
+        """
+        print(f"正在从 {repo_url} 下载...")
+        
+        files = self.get_github_repo_tree(repo_url, possible_dirs)
+        
+        # 文件树中已带有大小，过大的文件无需发起请求
+        oversized = [f for f in files if f['size'] > MAX_FILE_BYTES]
+        if oversized:
+            print(f"  跳过 {len(oversized)} 个超过 {MAX_FILE_BYTES // (1024 * 1024)}MB 的文件")
+            files = [f for f in files if f['size'] <= MAX_FILE_BYTES]
+        if max_files is not None:
+            files = files[:max_files]
+        
+        # 跳过之前运行已下载的文件，编号接在已有文件之后
+        with self.metadata_lock:
+            files = [f for f in files if f['download_url'] not in self.seen_urls]
+            start_index = sum(1 for record in self.metadata if record['filename'].startswith(f"{prefix}_"))
+        
+        return self.download_files(files, prefix, source, image_type, start_index)
+
+    def save_metadata(self, metadata_file=None):
+        """由JSONL日志生成完整的元数据文件"""
+        metadata_path = Path(metadata_file) if metadata_file else self.metadata_file
         metadata_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "total_images": len(self.metadata),
-                "download_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "source": "GitHub Repositories",
-                "images": self.metadata
-            }, f, indent=2, ensure_ascii=False)
+        images = [record for record in self.load_metadata_log() if 'duplicate_of' not in record]
+        metadata_path.write_bytes(json_dumps({
+            "total_images": len(images),
+            "download_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "source": "GitHub Repositories",
+            "images": images
+        }, indent=True))
         
         print(f"✓ 元数据保存到: {metadata_path}")
 
@@ -303,27 +409,27 @@ class GitHubIshiharaDownloader:
         
         total_downloaded = 0
         
-        # 从各个GitHub仓库下载
-        repositories = [
-            ("ishihara-plate-learning", self.download_from_ishihara_plate_learning),
-            ("IshiharaMC", self.download_from_icfaust_ishihara),
-            ("Color_Blindness_Toolkit", self.download_from_color_blindness_toolkit),
-            ("njtierney/ishihara", self.download_from_njtierney_ishihara),
-        ]
-        
-        for repo_name, download_func in repositories:
-            print(f"\n--- {repo_name} ---")
-            try:
-                downloaded = download_func()
-                total_downloaded += downloaded
-                print(f"从 {repo_name} 下载了 {downloaded} 张图像")
-            except Exception as e:
-                print(f"从 {repo_name} 下载失败: {e}")
+        # 各仓库互不依赖，并行下载以重叠网络等待
+        with ThreadPoolExecutor(max_workers=len(REPOSITORIES)) as executor:
+            futures = {
+                executor.submit(self._download_repo, *repo_args): repo_name
+                for repo_name, *repo_args in REPOSITORIES
+            }
+            for future in as_completed(futures):
+                repo_name = futures[future]
+                try:
+                    downloaded = future.result()
+                    total_downloaded += downloaded
+                    print(f"\n--- {repo_name} ---")
+                    print(f"从 {repo_name} 下载了 {downloaded} 张图像")
+                except Exception as e:
+                    print(f"从 {repo_name} 下载失败: {e}")
         
         # 保存元数据
         self.save_metadata()
         
         print(f"\n=== GitHub下载完成 ===")
+        print(f"本次新下载: {total_downloaded} 张图像")
         print(f"总共下载: {len(self.metadata)} 张图像")
         print(f"目标进度: {len(self.metadata)}/100")
         
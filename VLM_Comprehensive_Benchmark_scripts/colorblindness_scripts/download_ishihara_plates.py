@@ -4,27 +4,336 @@
 从多个开源数据源下载石原氏色盲测试图
 """
 
+import functools
+import io
 import os
 import requests
 import numpy as np
 from PIL import Image
-import json
 import time
+import zlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import urllib3
 from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import ssl
 import certifi
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+from io_utils import json_dumps, json_loads, save_stream
+
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# 合成测试图的PNG编码参数：zlib级别1比默认级别6快数倍，文件略大
+PNG_SAVE_OPTIONS = dict(format="PNG", optimize=False, compress_level=1)
+
+
+# 简化的数字形状定义，坐标为相对圆心的归一化坐标；标量和数组输入均可
+NUMBER_SHAPES = {
+    "8": lambda x, y: ((np.abs(y) < 0.6) & (np.abs(x) < 0.3)) | ((np.abs(y - 0.3) < 0.2) & (np.abs(x) < 0.25)) | ((np.abs(y + 0.3) < 0.2) & (np.abs(x) < 0.25)),
+    "3": lambda x, y: ((x > -0.1) & (x < 0.3) & (np.abs(y) < 0.6)) | ((np.abs(y) < 0.1) & (x > -0.3) & (x < 0.3)),
+    "5": lambda x, y: ((x > -0.3) & (x < 0.3) & (y > 0.2) & (y < 0.4)) | ((x > -0.3) & (x < 0.1) & (y > -0.4) & (y < 0.2)),
+    "2": lambda x, y: ((np.abs(y - 0.3) < 0.1) & (np.abs(x) < 0.3)) | ((np.abs(y + 0.3) < 0.1) & (np.abs(x) < 0.3)) | ((x > -0.1) & (x < 0.1) & (np.abs(y) < 0.6)),
+    "6": lambda x, y: ((np.abs(x + 0.2) < 0.1) & (np.abs(y) < 0.6)) | ((np.abs(y) < 0.1) & (x > -0.3) & (x < 0.3)),
+    "9": lambda x, y: ((np.abs(x + 0.2) < 0.1) & (y > -0.4) & (y < 0.4)) | ((np.abs(y - 0.3) < 0.1) & (x > -0.3) & (x < 0.3)),
+    "7": lambda x, y: ((y > 0.2) & (y < 0.4) & (np.abs(x) < 0.3)) | ((x > -0.1) & (x < 0.1) & (y > -0.4) & (y < 0.4)),
+    "4": lambda x, y: ((np.abs(x - 0.2) < 0.1) & (np.abs(y) < 0.6)) | ((np.abs(y) < 0.1) & (x > -0.3) & (x < 0.3)),
+    "1": lambda x, y: (np.abs(x) < 0.1) & (np.abs(y) < 0.6),
+    "0": lambda x, y: (np.abs(y) < 0.6) & (np.abs(x) < 0.3) & ~((np.abs(y) < 0.4) & (np.abs(x) < 0.1))
+}
+
+# 蓝黄测试图的符号形状定义，坐标为相对圆心的归一化坐标
+SYMBOL_SHAPES = {
+    "circle": lambda x, y: x*x + y*y <= 0.3*0.3,
+    "square": lambda x, y: (np.abs(x) <= 0.3) & (np.abs(y) <= 0.3),
+    "triangle": lambda x, y: (y >= -0.3) & (y <= 0.3) & (np.abs(x) <= (0.3 - y) * 0.5),
+    "diamond": lambda x, y: np.abs(x) + np.abs(y) <= 0.4,
+    "star": lambda x, y: (x*x + y*y <= 0.3*0.3) & (((np.abs(x) < 0.1) & (np.abs(y) < 0.3)) | ((np.abs(y) < 0.1) & (np.abs(x) < 0.3)) | ((np.abs(x-y) < 0.1) & (np.abs(x) < 0.3)) | ((np.abs(x+y) < 0.1) & (np.abs(x) < 0.3)))
+}
+
+
+def _dot_offsets(dot_size):
+    """直径为dot_size的圆点覆盖的(dy, dx)偏移，与逐像素绘制的范围一致"""
+    d = np.arange(-dot_size // 2, dot_size // 2 + 1)
+    dy, dx = np.meshgrid(d, d, indexing='ij')
+    inside = dx * dx + dy * dy <= dot_size * dot_size // 4
+    return dy[inside], dx[inside]
+
+
+# 测试图只使用直径3~8的圆点，预先算好每种直径的偏移
+DOT_KERNELS = {dot_size: _dot_offsets(dot_size) for dot_size in range(3, 9)}
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, boundscheck=False)
+    def _stamp_dots_numba(pixels, xs, ys, sizes, colors):
+        """逐点绘制圆点（numba编译）
+        
+        点之间按顺序串行绘制，重叠像素由后绘制的点决定。
+        """
+        height, width = pixels.shape[0], pixels.shape[1]
+        for i in range(xs.shape[0]):
+            x, y, dot_size = xs[i], ys[i], sizes[i]
+            limit = dot_size * dot_size // 4
+            for dx in range(-dot_size // 2, dot_size // 2 + 1):
+                for dy in range(-dot_size // 2, dot_size // 2 + 1):
+                    px, py = x + dx, y + dy
+                    if dx * dx + dy * dy <= limit and 0 <= px < width and 0 <= py < height:
+                        for c in range(3):
+                            pixels[py, px, c] = colors[i, c]
+
+
+def _stamp_dots(pixels, xs, ys, sizes, colors):
+    """按顺序把圆点绘制到pixels上，后绘制的点覆盖先绘制的点
+    
+    Args:
+        pixels: (H, W, 3) uint8图像，原地修改
+        xs, ys: 圆心坐标
+        sizes: 每个点的直径
+        colors: (n, 3) 每个点的颜色
+    """
+    if NUMBA_AVAILABLE:
+        _stamp_dots_numba(pixels, xs, ys, sizes, colors)
+        return
+    
+    height, width = pixels.shape[:2]
+    flat_index = []
+    dot_index = []
+    
+    # 相同直径的点共用一组偏移，一次性展开
+    for dot_size in np.unique(sizes):
+        selected = np.flatnonzero(sizes == dot_size)
+        dy, dx = DOT_KERNELS.get(int(dot_size)) or _dot_offsets(int(dot_size))
+        py = ys[selected, None] + dy
+        px = xs[selected, None] + dx
+        valid = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+        flat_index.append((py * width + px)[valid])
+        dot_index.append(np.broadcast_to(selected[:, None], valid.shape)[valid])
+    
+    if not flat_index:
+        return
+    flat_index = np.concatenate(flat_index)
+    dot_index = np.concatenate(dot_index)
+    
+    # 按点的绘制顺序排序，重复像素由最后写入的点决定
+    order = np.argsort(dot_index, kind='stable')
+    pixels.reshape(-1, 3)[flat_index[order]] = colors[dot_index[order]]
+
+
+def _dot_colors(rng, in_shape, fg_color, bg_color, variation=30):
+    """为每个点选择前景/背景色并一次性加入随机变化"""
+    fg = np.asarray(fg_color, dtype=np.int16)
+    bg = np.asarray(bg_color, dtype=np.int16)
+    base = np.where(in_shape[:, None], fg, bg)
+    jitter = rng.integers(-variation, variation + 1, size=base.shape, dtype=np.int16)
+    return np.clip(base + jitter, 0, 255).astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=8)
+def _circle_mask(width, height, radius):
+    """测试图圆形区域的布尔掩码，同一尺寸的所有测试图共用"""
+    ys, xs = np.ogrid[:height, :width]
+    mask = (xs - width // 2) ** 2 + (ys - height // 2) ** 2 <= radius ** 2
+    mask.setflags(write=False)
+    return mask
+
+
+def _shape_mask(shapes, key, x, y, center_x, center_y, radius):
+    """在相对圆心的归一化坐标上求形状谓词，未知形状返回全False"""
+    rel_x = np.asarray((x - center_x) / radius)
+    rel_y = np.asarray((y - center_y) / radius)
+    
+    shape_fn = shapes.get(key)
+    if shape_fn is not None:
+        return shape_fn(rel_x, rel_y)
+    return np.zeros(rel_x.shape, dtype=bool)
+
+
+@functools.lru_cache(maxsize=64)
+def _shape_grid(kind, key, width, height, radius):
+    """在整张画布上求一次形状谓词，返回(H, W)布尔掩码
+    
+    Args:
+        kind: "number"使用NUMBER_SHAPES，"symbol"使用SYMBOL_SHAPES
+        key: 数字或符号
+    """
+    shapes = NUMBER_SHAPES if kind == "number" else SYMBOL_SHAPES
+    ys, xs = np.ogrid[:height, :width]
+    mask = np.broadcast_to(
+        _shape_mask(shapes, key, xs, ys, width // 2, height // 2, radius), (height, width)
+    ).copy()
+    mask.setflags(write=False)
+    return mask
+
+
+def create_dot_pattern_image(number, fg_color, bg_color, size=(400, 400)):
+    """创建点状模式的石原氏风格图像"""
+    # 直接分配白色画布，不经过PIL图像再复制
+    pixels = np.full((size[1], size[0], 3), 255, dtype=np.uint8)
+    
+    # 创建随机点状背景
+    rng = np.random.default_rng(42)  # 确保可重现性
+    
+    # 创建圆形区域
+    center_x, center_y = size[0] // 2, size[1] // 2
+    radius = min(size) // 2 - 20
+    
+    # 一次生成全部随机点（点的密度为8000），只保留圆形区域内的点
+    xs = rng.integers(0, size[0], 8000)
+    ys = rng.integers(0, size[1], 8000)
+    inside = _circle_mask(size[0], size[1], radius)[ys, xs]
+    xs, ys = xs[inside], ys[inside]
+    
+    # 随机点大小
+    sizes = rng.integers(3, 8, len(xs))
+    
+    # 根据数字形状决定颜色
+    in_number = _shape_grid("number", number, size[0], size[1], radius)[ys, xs]
+    colors = _dot_colors(rng, in_number, fg_color, bg_color)
+    
+    # 绘制点
+    _stamp_dots(pixels, xs, ys, sizes, colors)
+    
+    return Image.fromarray(pixels, 'RGB')
+
+
+def create_shape_pattern_image(shape, fg_color, bg_color, size=(400, 400)):
+    """创建形状模式的测试图像"""
+    # 直接分配白色画布，不经过PIL图像再复制
+    pixels = np.full((size[1], size[0], 3), 255, dtype=np.uint8)
+    
+    # 基于形状的种子；用crc32而不是hash()，结果不随进程的哈希随机化变化
+    rng = np.random.default_rng(zlib.crc32(shape.encode('utf-8')) % 1000)
+    
+    center_x, center_y = size[0] // 2, size[1] // 2
+    radius = min(size) // 2 - 20
+    
+    xs = rng.integers(0, size[0], 6000)
+    ys = rng.integers(0, size[1], 6000)
+    inside = _circle_mask(size[0], size[1], radius)[ys, xs]
+    xs, ys = xs[inside], ys[inside]
+    
+    sizes = rng.integers(4, 9, len(xs))
+    in_shape = _shape_grid("symbol", shape, size[0], size[1], radius)[ys, xs]
+    colors = _dot_colors(rng, in_shape, fg_color, bg_color)
+    
+    _stamp_dots(pixels, xs, ys, sizes, colors)
+    
+    return Image.fromarray(pixels, 'RGB')
+
+
+@functools.lru_cache(maxsize=1)
+def _ishihara_cases():
+    """合成石原氏测试图的参数，返回(数字, 前景色, 背景色, 变体编号)元组"""
+    # 扩展数字模板和颜色配置 - 生成80个不同的数字测试图
+    base_cases = [
+        ("8", (255, 80, 80), (80, 255, 80)),
+        ("3", (255, 100, 100), (100, 200, 100)),
+        ("5", (200, 50, 50), (50, 180, 50)),
+        ("2", (255, 120, 120), (120, 255, 120)),
+        ("6", (180, 40, 40), (40, 160, 40)),
+        ("9", (255, 90, 90), (90, 200, 90)),
+        ("7", (220, 60, 60), (60, 220, 60)),
+        ("4", (255, 110, 110), (110, 255, 110)),
+        ("1", (190, 30, 30), (30, 150, 30)),
+        ("0", (255, 140, 140), (140, 255, 140)),
+    ]
+    
+    test_cases = []
+    # 为每个基础数字创建8个不同颜色变体
+    for number, fg_base, bg_base in base_cases:
+        for variant in range(8):
+            # 生成颜色变体
+            fg_shift = variant * 20
+            bg_shift = variant * 15
+            
+            test_cases.append((
+                number,
+                (
+                    max(50, min(255, fg_base[0] + fg_shift)),
+                    max(50, min(255, fg_base[1] - fg_shift//2)),
+                    max(50, min(255, fg_base[2] - fg_shift//3))
+                ),
+                (
+                    max(50, min(255, bg_base[0] - bg_shift//2)),
+                    max(50, min(255, bg_base[1] + bg_shift)),
+                    max(50, min(255, bg_base[2] - bg_shift//3))
+                ),
+                variant + 1
+            ))
+    
+    return tuple(test_cases)
+
+
+@functools.lru_cache(maxsize=1)
+def _blue_yellow_cases():
+    """蓝黄测试图的参数，返回(符号, 前景色, 背景色, 变体编号)元组"""
+    # 扩展蓝黄色盲测试图 - 创建20个不同变体
+    base_symbols = ["circle", "square", "triangle", "diamond", "star"]
+    blue_yellow_cases = []
+    
+    for symbol in base_symbols:
+        for variant in range(4):  # 每个符号4个变体
+            variant_shift = variant * 30
+            blue_yellow_cases.append((
+                symbol,
+                (
+                    max(50, min(255, 100 + variant_shift)),
+                    max(50, min(255, 100 + variant_shift//2)),
+                    255
+                ),
+                (
+                    255,
+                    255,
+                    max(50, min(255, 100 + variant_shift//3))
+                ),
+                variant + 1
+            ))
+    
+    return tuple(blue_yellow_cases)
+
+
+def _render_plate(plate):
+    """在工作进程中绘制一张测试图，返回(PNG字节, 错误信息)
+    
+    Args:
+        plate: ("number" | "symbol", 数字或符号, 前景色, 背景色)
+    """
+    kind, shape, fg_color, bg_color = plate
+    try:
+        if kind == "number":
+            image = create_dot_pattern_image(shape, fg_color, bg_color)
+        else:
+            image = create_shape_pattern_image(shape, fg_color, bg_color)
+        buffer = io.BytesIO()
+        image.save(buffer, **PNG_SAVE_OPTIONS)
+        return buffer.getvalue(), None
+    except Exception as e:
+        return None, str(e)
+
+
 class IshiharaDownloader:
-    def __init__(self, base_dir="data/raw"):
+    def __init__(self, base_dir="data/raw", metadata_file="metadata/base_images_metadata.json"):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
         self.metadata = []
         
+        # 上次运行的元数据，按文件名索引；文件仍在时重新运行可以跳过下载和生成
+        self.metadata_file = Path(metadata_file)
+        self.previous_metadata = {}
+        if self.metadata_file.exists():
+            for image in json_loads(self.metadata_file.read_bytes()).get("images", []):
+                self.previous_metadata[image["filename"]] = image
+        
         # 设置requests会话，配置重试和SSL
         self.session = requests.Session()
         self.session.verify = False  # 暂时禁用SSL验证以解决连接问题
@@ -32,8 +341,146 @@ class IshiharaDownloader:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
         
+        # 所有请求共用一个会话，连接池覆盖并发线程数，复用keep-alive连接和TLS会话；
+        # 服务器瞬时错误按指数退避重试
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=['GET']
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # 礼貌性限速只作用于同一主机：每个主机的并发请求数上限和请求间隔，
+        # 不同主机之间互不等待
+        self.per_host = 4
+        self.host_interval = 0.25
+        self.host_semaphores = {}
+        self.host_next_request = {}
+        self.host_lock = threading.Lock()
+    
+    def host_semaphore(self, url):
+        """获取URL所在主机的信号量"""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.Semaphore(self.per_host)
+            return self.host_semaphores[host]
+    
+    def wait_for_host(self, url, min_interval):
+        """为URL所在主机预约下一个请求时刻，并等待到该时刻"""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            now = time.monotonic()
+            start = max(now, self.host_next_request.get(host, now))
+            self.host_next_request[host] = start + min_interval
+        if start > now:
+            time.sleep(start - now)
+    
+    def cached_record(self, filename, **expected):
+        """文件已存在且上次的元数据与expected一致时，返回上次的元数据记录"""
+        record = self.previous_metadata.get(filename)
+        if record is None or any(record.get(key) != value for key, value in expected.items()):
+            return None
+        filepath = self.base_dir / filename
+        if not filepath.exists() or filepath.stat().st_size == 0:
+            return None
+        return record
+    
+    def _fetch(self, url, filename, entry, headers=None, min_interval=None):
+        """下载单个URL并保存为filename
+        
+        已下载过的文件用ETag/Last-Modified发送条件请求，304时直接复用。
+        
+        Returns:
+            成功时返回元数据记录，否则返回None
+        """
+        filepath = self.base_dir / filename
+        request_headers = dict(headers or {})
+        
+        cached = self.cached_record(filename, url=url)
+        if cached is not None:
+            if not cached.get("etag") and not cached.get("last_modified"):
+                # 没有可用于重新验证的信息，直接复用
+                return cached
+            if cached.get("etag"):
+                request_headers['If-None-Match'] = cached["etag"]
+            if cached.get("last_modified"):
+                request_headers['If-Modified-Since'] = cached["last_modified"]
+        
+        self.wait_for_host(url, self.host_interval if min_interval is None else min_interval)
+        with self.host_semaphore(url):
+            with self.session.get(url, timeout=30, headers=request_headers, stream=True) as response:
+                if response.status_code == 304 and cached is not None:
+                    return cached
+                if response.status_code != 200:
+                    return None
+                save_stream(response, filepath, chunk_size=1024 * 1024)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        
+        record = {"filename": filename, "source": entry["source"], "url": url}
+        record.update(entry)
+        if etag:
+            record["etag"] = etag
+        if last_modified:
+            record["last_modified"] = last_modified
+        return record
+    
+    def make_batch(self, tasks, error_label="下载失败", headers=None, min_interval=None):
+        """把一个来源的下载任务和共用的请求选项打包
+        
+        Args:
+            tasks: [(url, filename, entry), ...]；entry为元数据中除filename和url外的字段
+            error_label: 失败时打印的提示
+            headers: 额外的请求头
+            min_interval: 同一主机两次请求之间的最小间隔（秒），默认为self.host_interval
+        """
+        return {"tasks": tasks, "error_label": error_label, "headers": headers, "min_interval": min_interval}
+    
+    def download_batches(self, batches, max_workers=16):
+        """在一个线程池中并发下载多个来源的URL，元数据按来源和任务顺序追加
+        
+        不同来源通常位于不同主机，放在同一个线程池中可以同时进行，
+        同一主机的请求仍由wait_for_host和host_semaphore限速。
+        """
+        def fetch(job):
+            _, (url, filename, entry), batch = job
+            try:
+                record = self._fetch(url, filename, entry, batch["headers"], batch["min_interval"])
+            except Exception as e:
+                print(f"✗ {batch['error_label']} {url}: {e}")
+                return None
+            if record is not None:
+                print(f"✓ 下载成功: {record['filename']}")
+            return record
+        
+        # 各来源的任务轮流提交，避免线程全部等待同一主机的限速
+        jobs = []
+        for position in range(max((len(batch["tasks"]) for batch in batches), default=0)):
+            for order, batch in enumerate(batches):
+                if position < len(batch["tasks"]):
+                    jobs.append(((order, position), batch["tasks"][position], batch))
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            records = dict(zip((job[0] for job in jobs), executor.map(fetch, jobs)))
+        
+        for key in sorted(records):
+            if records[key] is not None:
+                self.metadata.append(records[key])
+        
     def download_from_wikimedia_commons(self):
         """从维基媒体共享资源下载石原氏测试图"""
+        print("正在从维基媒体共享资源下载...")
+        self.download_batches([self.wikimedia_batch()])
+    
+    def wikimedia_batch(self):
+        """维基媒体共享资源的下载任务"""
         # 扩展的维基媒体共享资源石原氏测试图URL列表
         wikimedia_urls = [
             "https://upload.wikimedia.org/wikipedia/commons/e/e0/Ishihara_9.png",
@@ -77,170 +524,104 @@ class IshiharaDownloader:
             "https://upload.wikimedia.org/wikipedia/commons/c/cb/Ishihara_38.png",
         ]
         
-        print("正在从维基媒体共享资源下载...")
-        for i, url in enumerate(wikimedia_urls):
-            try:
-                response = self.session.get(url, timeout=30)
-                if response.status_code == 200:
-                    filename = f"wikimedia_ishihara_{i+1:02d}.png"
-                    filepath = self.base_dir / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    self.metadata.append({
-                        "filename": filename,
-                        "source": "Wikimedia Commons",
-                        "url": url,
-                        "type": "ishihara",
-                        "expected_number": "unknown"
-                    })
-                    print(f"✓ 下载成功: {filename}")
-                    time.sleep(1)  # 礼貌性延迟
-                    
-            except Exception as e:
-                print(f"✗ 下载失败 {url}: {e}")
+        entry = {"source": "Wikimedia Commons", "type": "ishihara", "expected_number": "unknown"}
+        return self.make_batch([
+            (url, f"wikimedia_ishihara_{i+1:02d}.png", entry)
+            for i, url in enumerate(wikimedia_urls)
+        ])
     
     def create_synthetic_ishihara_plates(self):
         """创建合成的石原氏风格测试图"""
         print("正在创建合成石原氏测试图...")
         
-        # 扩展数字模板和颜色配置 - 生成80个不同的数字测试图
-        base_cases = [
-            {"number": "8", "fg_base": (255, 80, 80), "bg_base": (80, 255, 80)},
-            {"number": "3", "fg_base": (255, 100, 100), "bg_base": (100, 200, 100)},
-            {"number": "5", "fg_base": (200, 50, 50), "bg_base": (50, 180, 50)},
-            {"number": "2", "fg_base": (255, 120, 120), "bg_base": (120, 255, 120)},
-            {"number": "6", "fg_base": (180, 40, 40), "bg_base": (40, 160, 40)},
-            {"number": "9", "fg_base": (255, 90, 90), "bg_base": (90, 200, 90)},
-            {"number": "7", "fg_base": (220, 60, 60), "bg_base": (60, 220, 60)},
-            {"number": "4", "fg_base": (255, 110, 110), "bg_base": (110, 255, 110)},
-            {"number": "1", "fg_base": (190, 30, 30), "bg_base": (30, 150, 30)},
-            {"number": "0", "fg_base": (255, 140, 140), "bg_base": (140, 255, 140)},
-        ]
-        
-        test_cases = []
-        # 为每个基础数字创建8个不同颜色变体
-        for base_case in base_cases:
-            for variant in range(8):
-                # 生成颜色变体
-                fg_shift = variant * 20
-                bg_shift = variant * 15
-                
-                test_cases.append({
-                    "number": base_case["number"],
-                    "fg_color": (
-                        max(50, min(255, base_case["fg_base"][0] + fg_shift)),
-                        max(50, min(255, base_case["fg_base"][1] - fg_shift//2)),
-                        max(50, min(255, base_case["fg_base"][2] - fg_shift//3))
-                    ),
-                    "bg_color": (
-                        max(50, min(255, base_case["bg_base"][0] - bg_shift//2)),
-                        max(50, min(255, base_case["bg_base"][1] + bg_shift)),
-                        max(50, min(255, base_case["bg_base"][2] - bg_shift//3))
-                    ),
-                    "variant": variant + 1
-                })
-        
-        for i, case in enumerate(test_cases):
-            try:
-                image = self.create_dot_pattern_image(
-                    case["number"], 
-                    case["fg_color"], 
-                    case["bg_color"]
-                )
-                
-                filename = f"synthetic_ishihara_{case['number']}_v{case['variant']:02d}.png"
-                filepath = self.base_dir / filename
-                image.save(filepath)
-                
-                self.metadata.append({
+        plates = []
+        for number, fg_color, bg_color, variant in _ishihara_cases():
+            filename = f"synthetic_ishihara_{number}_v{variant:02d}.png"
+            cached = self.cached_record(
+                filename,
+                expected_number=number,
+                fg_color=list(fg_color),
+                bg_color=list(bg_color)
+            )
+            plates.append((
+                filename,
+                ("number", number, fg_color, bg_color),
+                cached or {
                     "filename": filename,
                     "source": "Synthetic Generation",
                     "url": "locally_generated",
                     "type": "ishihara_synthetic",
-                    "expected_number": case["number"],
-                    "variant": case["variant"],
-                    "fg_color": case["fg_color"],
-                    "bg_color": case["bg_color"]
-                })
-                print(f"✓ 创建成功: {filename}")
-                
-            except Exception as e:
-                print(f"✗ 创建失败 {case['number']}: {e}")
+                    "expected_number": number,
+                    "variant": variant,
+                    "fg_color": fg_color,
+                    "bg_color": bg_color
+                },
+                cached is not None
+            ))
+        
+        self.render_plates(plates)
+    
+    def render_plates(self, plates, max_workers=None, io_workers=4):
+        """在进程池中并行绘制测试图，主进程写入文件和元数据
+        
+        文件写入交给一个小线程池，与接收下一张测试图重叠进行。
+        
+        Args:
+            plates: [(文件名, _render_plate的参数, 元数据记录, 是否已缓存), ...]
+            max_workers: 进程数，默认为CPU核数
+            io_workers: 写文件的线程数
+        """
+        pending = [plate for _, plate, _, cached in plates if not cached]
+        rendered = iter(())
+        executor = None
+        if pending:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            rendered = executor.map(_render_plate, pending, chunksize=4)
+        
+        writes = []
+        with ThreadPoolExecutor(max_workers=io_workers) as writer:
+            try:
+                for filename, plate, record, cached in plates:
+                    if cached:
+                        writes.append((record, None))
+                        continue
+                    
+                    png_bytes, error = next(rendered)
+                    if error is not None:
+                        print(f"✗ 创建失败 {plate[1]}: {error}")
+                        continue
+                    
+                    future = writer.submit((self.base_dir / filename).write_bytes, png_bytes)
+                    writes.append((record, future))
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+        
+        for record, future in writes:
+            if future is not None:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"✗ 创建失败 {record['filename']}: {e}")
+                    continue
+                print(f"✓ 创建成功: {record['filename']}")
+            self.metadata.append(record)
     
     def create_dot_pattern_image(self, number, fg_color, bg_color, size=(400, 400)):
         """创建点状模式的石原氏风格图像"""
-        image = Image.new('RGB', size, 'white')
-        pixels = np.array(image)
-        
-        # 创建随机点状背景
-        np.random.seed(42)  # 确保可重现性
-        
-        # 创建圆形区域
-        center_x, center_y = size[0] // 2, size[1] // 2
-        radius = min(size) // 2 - 20
-        
-        # 生成随机点
-        for _ in range(8000):  # 点的密度
-            x = np.random.randint(0, size[0])
-            y = np.random.randint(0, size[1])
-            
-            # 检查是否在圆形区域内
-            if (x - center_x) ** 2 + (y - center_y) ** 2 <= radius ** 2:
-                # 随机点大小
-                dot_size = np.random.randint(3, 8)
-                
-                # 根据数字形状决定颜色
-                if self.is_in_number_shape(x, y, number, center_x, center_y, radius):
-                    color = self.add_color_variation(fg_color)
-                else:
-                    color = self.add_color_variation(bg_color)
-                
-                # 绘制点
-                for dx in range(-dot_size//2, dot_size//2 + 1):
-                    for dy in range(-dot_size//2, dot_size//2 + 1):
-                        if (dx*dx + dy*dy <= dot_size*dot_size//4 and 
-                            0 <= x+dx < size[0] and 0 <= y+dy < size[1]):
-                            pixels[y+dy, x+dx] = color
-        
-        return Image.fromarray(pixels)
+        return create_dot_pattern_image(number, fg_color, bg_color, size)
     
     def is_in_number_shape(self, x, y, number, center_x, center_y, radius):
-        """简单的数字形状检测"""
-        # 相对于中心的坐标
-        rel_x = (x - center_x) / radius
-        rel_y = (y - center_y) / radius
-        
-        # 简化的数字形状定义
-        shapes = {
-            "8": lambda x, y: (abs(y) < 0.6 and abs(x) < 0.3) or (abs(y - 0.3) < 0.2 and abs(x) < 0.25) or (abs(y + 0.3) < 0.2 and abs(x) < 0.25),
-            "3": lambda x, y: (x > -0.1 and x < 0.3 and abs(y) < 0.6) or (abs(y) < 0.1 and x > -0.3 and x < 0.3),
-            "5": lambda x, y: (x > -0.3 and x < 0.3 and y > 0.2 and y < 0.4) or (x > -0.3 and x < 0.1 and y > -0.4 and y < 0.2),
-            "2": lambda x, y: (abs(y - 0.3) < 0.1 and abs(x) < 0.3) or (abs(y + 0.3) < 0.1 and abs(x) < 0.3) or (x > -0.1 and x < 0.1 and abs(y) < 0.6),
-            "6": lambda x, y: (abs(x + 0.2) < 0.1 and abs(y) < 0.6) or (abs(y) < 0.1 and x > -0.3 and x < 0.3),
-            "9": lambda x, y: (abs(x + 0.2) < 0.1 and y > -0.4 and y < 0.4) or (abs(y - 0.3) < 0.1 and x > -0.3 and x < 0.3),
-            "7": lambda x, y: (y > 0.2 and y < 0.4 and abs(x) < 0.3) or (x > -0.1 and x < 0.1 and y > -0.4 and y < 0.4),
-            "4": lambda x, y: (abs(x - 0.2) < 0.1 and abs(y) < 0.6) or (abs(y) < 0.1 and x > -0.3 and x < 0.3),
-            "1": lambda x, y: abs(x) < 0.1 and abs(y) < 0.6,
-            "0": lambda x, y: abs(y) < 0.6 and abs(x) < 0.3 and not (abs(y) < 0.4 and abs(x) < 0.1)
-        }
-        
-        if number in shapes:
-            return shapes[number](rel_x, rel_y)
-        return False
-    
-    def add_color_variation(self, base_color, variation=30):
-        """为颜色添加随机变化"""
-        return tuple(
-            max(0, min(255, c + np.random.randint(-variation, variation + 1)))
-            for c in base_color
-        )
+        """简单的数字形状检测，x和y可以是标量或数组"""
+        return _shape_mask(NUMBER_SHAPES, number, x, y, center_x, center_y, radius)
     
     def download_from_github_repos(self):
         """从GitHub仓库下载图像"""
         print("正在尝试从GitHub仓库获取资源...")
-        
+        self.download_batches([self.github_batch()])
+    
+    def github_batch(self):
+        """GitHub仓库的下载任务"""
         # 扩展GitHub raw文件URLs - 从多个开源项目获取
         github_urls = []
         
@@ -258,33 +639,19 @@ class IshiharaDownloader:
         ]
         github_urls.extend(additional_urls)
         
-        for i, url in enumerate(github_urls):
-            try:
-                response = requests.get(url, timeout=30)
-                if response.status_code == 200:
-                    filename = f"github_ishihara_{i+1}.png"
-                    filepath = self.base_dir / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    self.metadata.append({
-                        "filename": filename,
-                        "source": "GitHub Repository",
-                        "url": url,
-                        "type": "ishihara",
-                        "expected_number": "unknown"
-                    })
-                    print(f"✓ 下载成功: {filename}")
-                    time.sleep(1)
-                    
-            except Exception as e:
-                print(f"✗ GitHub下载失败 {url}: {e}")
+        entry = {"source": "GitHub Repository", "type": "ishihara", "expected_number": "unknown"}
+        return self.make_batch([
+            (url, f"github_ishihara_{i+1}.png", entry)
+            for i, url in enumerate(github_urls)
+        ], error_label="GitHub下载失败")
     
     def download_from_research_datasets(self):
         """从研究数据集和开源资源下载"""
         print("正在从研究数据集下载...")
-        
+        self.download_batches([self.research_batch()])
+    
+    def research_batch(self):
+        """研究数据集的下载任务"""
         # 色盲测试相关的开源数据集URL
         research_urls = [
             # Color Vision Research Laboratory 测试图
@@ -300,33 +667,19 @@ class IshiharaDownloader:
             "https://colorlab.wickline.org/colorblind/ishihara/Ishihara.10.jpg",
         ]
         
-        for i, url in enumerate(research_urls):
-            try:
-                response = requests.get(url, timeout=30)
-                if response.status_code == 200:
-                    filename = f"research_ishihara_{i+1:02d}.jpg"
-                    filepath = self.base_dir / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    self.metadata.append({
-                        "filename": filename,
-                        "source": "Research Dataset",
-                        "url": url,
-                        "type": "ishihara",
-                        "expected_number": "unknown"
-                    })
-                    print(f"✓ 下载成功: {filename}")
-                    time.sleep(1)
-                    
-            except Exception as e:
-                print(f"✗ 研究数据集下载失败 {url}: {e}")
+        entry = {"source": "Research Dataset", "type": "ishihara", "expected_number": "unknown"}
+        return self.make_batch([
+            (url, f"research_ishihara_{i+1:02d}.jpg", entry)
+            for i, url in enumerate(research_urls)
+        ], error_label="研究数据集下载失败")
     
     def search_and_download_additional_sources(self):
         """搜索并下载额外的色盲测试图源"""
         print("正在搜索额外的测试图源...")
-        
+        self.download_batches([self.medical_batch()])
+    
+    def medical_batch(self):
+        """医学教育网站的下载任务"""
         # 尝试从医学教育网站获取
         medical_urls = [
             # 这些URL需要根据实际可用资源进行验证和调整
@@ -336,140 +689,63 @@ class IshiharaDownloader:
             "https://www.enchroma.com/images/test-2.png",
         ]
         
-        for i, url in enumerate(medical_urls):
-            try:
-                response = requests.get(url, timeout=30, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
-                if response.status_code == 200:
-                    filename = f"medical_colortest_{i+1:02d}.jpg"
-                    filepath = self.base_dir / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    self.metadata.append({
-                        "filename": filename,
-                        "source": "Medical Education Website",
-                        "url": url,
-                        "type": "colorblindness_test",
-                        "expected_answer": "unknown"
-                    })
-                    print(f"✓ 下载成功: {filename}")
-                    time.sleep(2)  # 更长的延迟，礼貌性访问
-                    
-            except Exception as e:
-                print(f"✗ 医学网站下载失败 {url}: {e}")
+        entry = {"source": "Medical Education Website", "type": "colorblindness_test", "expected_answer": "unknown"}
+        return self.make_batch([
+            (url, f"medical_colortest_{i+1:02d}.jpg", entry)
+            for i, url in enumerate(medical_urls)
+        ], error_label="医学网站下载失败", min_interval=2 * self.host_interval, headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
     
     def create_additional_test_patterns(self):
         """创建额外的测试模式"""
         print("正在创建额外的测试模式...")
         
-        # 扩展蓝黄色盲测试图 - 创建20个不同变体
-        base_symbols = ["circle", "square", "triangle", "diamond", "star"]
-        blue_yellow_cases = []
-        
-        for symbol in base_symbols:
-            for variant in range(4):  # 每个符号4个变体
-                variant_shift = variant * 30
-                blue_yellow_cases.append({
-                    "symbol": symbol,
-                    "fg_color": (
-                        max(50, min(255, 100 + variant_shift)),
-                        max(50, min(255, 100 + variant_shift//2)),
-                        255
-                    ),
-                    "bg_color": (
-                        255,
-                        255,
-                        max(50, min(255, 100 + variant_shift//3))
-                    ),
-                    "variant": variant + 1
-                })
-        
-        for i, case in enumerate(blue_yellow_cases):
-            try:
-                image = self.create_shape_pattern_image(
-                    case["symbol"],
-                    case["fg_color"],
-                    case["bg_color"]
-                )
-                
-                filename = f"blue_yellow_test_{case['symbol']}_v{case['variant']:02d}.png"
-                filepath = self.base_dir / filename
-                image.save(filepath)
-                
-                self.metadata.append({
+        plates = []
+        for symbol, fg_color, bg_color, variant in _blue_yellow_cases():
+            filename = f"blue_yellow_test_{symbol}_v{variant:02d}.png"
+            cached = self.cached_record(
+                filename,
+                expected_symbol=symbol,
+                fg_color=list(fg_color),
+                bg_color=list(bg_color)
+            )
+            plates.append((
+                filename,
+                ("symbol", symbol, fg_color, bg_color),
+                cached or {
                     "filename": filename,
                     "source": "Synthetic Generation",
                     "url": "locally_generated",
                     "type": "blue_yellow_test",
-                    "expected_symbol": case["symbol"],
-                    "variant": case["variant"],
-                    "fg_color": case["fg_color"],
-                    "bg_color": case["bg_color"]
-                })
-                print(f"✓ 创建成功: {filename}")
-                
-            except Exception as e:
-                print(f"✗ 创建失败 {case['symbol']}: {e}")
+                    "expected_symbol": symbol,
+                    "variant": variant,
+                    "fg_color": fg_color,
+                    "bg_color": bg_color
+                },
+                cached is not None
+            ))
+        
+        self.render_plates(plates)
     
     def create_shape_pattern_image(self, shape, fg_color, bg_color, size=(400, 400)):
         """创建形状模式的测试图像"""
-        image = Image.new('RGB', size, 'white')
-        pixels = np.array(image)
-        
-        np.random.seed(hash(shape) % 1000)  # 基于形状的种子
-        
-        center_x, center_y = size[0] // 2, size[1] // 2
-        radius = min(size) // 2 - 20
-        
-        for _ in range(6000):
-            x = np.random.randint(0, size[0])
-            y = np.random.randint(0, size[1])
-            
-            if (x - center_x) ** 2 + (y - center_y) ** 2 <= radius ** 2:
-                dot_size = np.random.randint(4, 9)
-                
-                if self.is_in_shape(x, y, shape, center_x, center_y, radius):
-                    color = self.add_color_variation(fg_color)
-                else:
-                    color = self.add_color_variation(bg_color)
-                
-                for dx in range(-dot_size//2, dot_size//2 + 1):
-                    for dy in range(-dot_size//2, dot_size//2 + 1):
-                        if (dx*dx + dy*dy <= dot_size*dot_size//4 and 
-                            0 <= x+dx < size[0] and 0 <= y+dy < size[1]):
-                            pixels[y+dy, x+dx] = color
-        
-        return Image.fromarray(pixels)
+        return create_shape_pattern_image(shape, fg_color, bg_color, size)
     
     def is_in_shape(self, x, y, shape, center_x, center_y, radius):
-        """检测是否在指定形状内"""
-        rel_x = (x - center_x) / radius
-        rel_y = (y - center_y) / radius
-        
-        shapes = {
-            "circle": lambda x, y: x*x + y*y <= 0.3*0.3,
-            "square": lambda x, y: abs(x) <= 0.3 and abs(y) <= 0.3,
-            "triangle": lambda x, y: y >= -0.3 and y <= 0.3 and abs(x) <= (0.3 - y) * 0.5,
-            "diamond": lambda x, y: abs(x) + abs(y) <= 0.4,
-            "star": lambda x, y: (x*x + y*y <= 0.3*0.3) and ((abs(x) < 0.1 and abs(y) < 0.3) or (abs(y) < 0.1 and abs(x) < 0.3) or (abs(x-y) < 0.1 and abs(x) < 0.3) or (abs(x+y) < 0.1 and abs(x) < 0.3))
-        }
-        
-        return shapes.get(shape, lambda x, y: False)(rel_x, rel_y)
+        """检测是否在指定形状内，x和y可以是标量或数组"""
+        return _shape_mask(SYMBOL_SHAPES, shape, x, y, center_x, center_y, radius)
     
-    def save_metadata(self, metadata_file="metadata/base_images_metadata.json"):
+    def save_metadata(self, metadata_file=None):
         """保存元数据"""
-        metadata_path = Path(metadata_file)
+        metadata_path = Path(metadata_file) if metadata_file else self.metadata_file
         metadata_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "total_images": len(self.metadata),
-                "download_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "images": self.metadata
-            }, f, indent=2, ensure_ascii=False)
+        metadata_path.write_bytes(json_dumps({
+            "total_images": len(self.metadata),
+            "download_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "images": self.metadata
+        }, indent=True))
         
         print(f"✓ 元数据保存到: {metadata_path}")
     
@@ -479,11 +755,13 @@ class IshiharaDownloader:
         print(f"目标目录: {self.base_dir}")
         print("正在从网络数据集下载真实的色盲测试图...")
         
-        # 从各种网络源下载真实图像
-        self.download_from_wikimedia_commons()
-        self.download_from_github_repos() 
-        self.download_from_research_datasets()
-        self.search_and_download_additional_sources()
+        # 从各种网络源下载真实图像；各来源位于不同主机，在同一个线程池中同时下载
+        self.download_batches([
+            self.wikimedia_batch(),
+            self.github_batch(),
+            self.research_batch(),
+            self.medical_batch(),
+        ])
         
         # 保存元数据
         self.save_metadata()
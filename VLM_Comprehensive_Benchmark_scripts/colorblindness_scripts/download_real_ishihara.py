@@ -7,14 +7,57 @@
 import os
 import requests
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from PIL import Image
 import urllib3
 from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from io_utils import save_stream
 
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# 并发下载的最大请求数
+MAX_CONCURRENT_DOWNLOADS = 8
+
+# 对同一主机的最大并发请求数（代替请求之间的固定延迟）
+MAX_REQUESTS_PER_HOST = 4
+
+# PIL能够打开的图像扩展名（小写，含点）
+VALID_EXTS = frozenset(
+    ext for ext, fmt in Image.registered_extensions().items() if fmt in Image.OPEN
+)
+
+# 接受的图像文件头：PNG、JPEG、GIF、BMP、TIFF；WebP另需检查偏移8处的'WEBP'
+IMAGE_SIGNATURES = (
+    b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'BM',
+    b'II*\x00', b'MM\x00*',
+)
+
+
+def _validate_image(filepath, enhanced_validation=False):
+    """按扩展名和文件头校验图像，无效时抛出ValueError
+    
+    默认只读取前16个字节；enhanced_validation为True时再完整解码一次。
+    """
+    if filepath.suffix.lower() not in VALID_EXTS:
+        raise ValueError(f"不支持的图像扩展名: {filepath.suffix}")
+    
+    with open(filepath, 'rb') as f:
+        head = f.read(16)
+    is_webp = head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    if not (is_webp or head.startswith(IMAGE_SIGNATURES)):
+        raise ValueError("文件头不是支持的图像格式")
+    
+    if enhanced_validation:
+        with Image.open(filepath) as img:
+            img.load()
+
 class RealIshiharaDownloader:
     def __init__(self, base_dir="data/raw"):
         self.base_dir = Path(base_dir)
@@ -25,11 +68,74 @@ class RealIshiharaDownloader:
         self.session = requests.Session()
         self.session.verify = False  # 禁用SSL验证
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
         })
+        
+        # 连接池让同一主机的后续请求复用TCP/TLS连接；
+        # 限流和临时错误由带退避的重试处理
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=['GET']
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch(self, url, part_path):
+        """流式GET一个URL到临时文件，不在内存中保留完整响应
+        
+        Returns:
+            (状态码, 临时文件路径, 写入的字节数, 响应头)；非200时不创建文件
+        """
+        with self.session.get(url, timeout=30, stream=True) as response:
+            if response.status_code != 200:
+                return response.status_code, part_path, 0, response.headers
+            size = save_stream(response, part_path)
+            return response.status_code, part_path, size, response.headers
+
+    def fetch_all(self, urls):
+        """并发GET一组URL
+        
+        总并发数受MAX_CONCURRENT_DOWNLOADS限制，同一主机的并发数受
+        MAX_REQUESTS_PER_HOST限制。
+        
+        成功的响应先写入base_dir下的临时文件，由调用方重命名或删除。
+        
+        Returns:
+            与urls顺序一致的(fetch结果, 异常)列表，失败时结果为None
+        """
+        host_limits = {
+            host: threading.Semaphore(MAX_REQUESTS_PER_HOST)
+            for host in {urlparse(url).netloc for url in urls}
+        }
+        
+        def fetch_one(indexed_url):
+            index, url = indexed_url
+            part_path = self.base_dir / f".fetch_{index}.part"
+            with host_limits[urlparse(url).netloc]:
+                try:
+                    return self.fetch(url, part_path), None
+                except Exception as e:
+                    return None, e
+        
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS) as executor:
+            return list(executor.map(fetch_one, enumerate(urls)))
+
+    def discard_parts(self, results):
+        """删除fetch_all结果中未被使用的临时文件"""
+        for fetched, _ in results:
+            if fetched is not None:
+                fetched[1].unlink(missing_ok=True)
 
-    def download_from_multiple_sources(self):
-        """从多个网络源下载真实的色盲测试图"""
+    def multiple_source_urls(self):
+        """多个网络源的(来源名称, URL)列表"""
         
         # 数据源1: Wikimedia Commons (完整的石原氏测试图集)
         wikimedia_urls = [
@@ -65,69 +171,83 @@ class RealIshiharaDownloader:
             ("Medical Education", medical_edu_urls),
         ]
         
+        return [(source_name, url) for source_name, urls in all_sources for url in urls]
+
+    def download_from_multiple_sources(self, results=None, enhanced_validation=False):
+        """从多个网络源下载真实的色盲测试图
+        
+        Args:
+            results: multiple_source_urls对应的fetch_all结果；为None时在此处并发下载
+            enhanced_validation: 是否在文件头检查之外完整解码每张图像
+        """
+        sources = self.multiple_source_urls()
+        if results is None:
+            results = self.fetch_all([url for _, url in sources])
+        
         total_downloaded = 0
+        current_source = None
         
-        for source_name, urls in all_sources:
-            print(f"\n正在从 {source_name} 下载...")
+        for (source_name, url), (fetched, error) in zip(sources, results):
+            if source_name != current_source:
+                current_source = source_name
+                print(f"\n正在从 {source_name} 下载...")
             
-            for i, url in enumerate(urls):
-                if total_downloaded >= 100:
-                    break
-                    
+            if total_downloaded >= 100:
+                break
+            
+            print(f"  尝试下载: {url}")
+            if error is not None:
+                print(f"  ✗ 下载失败: {error}")
+                continue
+            
+            status_code, part_path, file_size, headers = fetched
+            if status_code != 200:
+                print(f"  ✗ HTTP错误 {status_code}: {url}")
+                continue
+            
+            try:
+                # 确定文件扩展名
+                content_type = headers.get('content-type', '')
+                if 'image' in content_type:
+                    if 'png' in content_type:
+                        ext = '.png'
+                    elif 'jpeg' in content_type or 'jpg' in content_type:
+                        ext = '.jpg'
+                    else:
+                        ext = '.jpg'  # 默认
+                else:
+                    # 从URL推断
+                    ext = '.png' if url.lower().endswith('.png') else '.jpg'
+                
+                filename = f"{source_name.lower().replace(' ', '_')}_{total_downloaded+1:03d}{ext}"
+                filepath = self.base_dir / filename
+                
+                part_path.replace(filepath)
+                
+                # 验证图像是否有效
                 try:
-                    print(f"  尝试下载: {url}")
-                    response = self.session.get(url, timeout=30)
+                    _validate_image(filepath, enhanced_validation)
                     
-                    if response.status_code == 200:
-                        # 确定文件扩展名
-                        content_type = response.headers.get('content-type', '')
-                        if 'image' in content_type:
-                            if 'png' in content_type:
-                                ext = '.png'
-                            elif 'jpeg' in content_type or 'jpg' in content_type:
-                                ext = '.jpg'
-                            else:
-                                ext = '.jpg'  # 默认
-                        else:
-                            # 从URL推断
-                            ext = '.png' if url.lower().endswith('.png') else '.jpg'
-                        
-                        filename = f"{source_name.lower().replace(' ', '_')}_{total_downloaded+1:03d}{ext}"
-                        filepath = self.base_dir / filename
-                        
-                        with open(filepath, 'wb') as f:
-                            f.write(response.content)
-                        
-                        # 验证图像是否有效
-                        try:
-                            from PIL import Image
-                            img = Image.open(filepath)
-                            img.verify()  # 验证图像完整性
-                            
-                            self.metadata.append({
-                                "filename": filename,
-                                "source": source_name,
-                                "url": url,
-                                "type": "ishihara_real",
-                                "file_size": len(response.content),
-                                "content_type": content_type
-                            })
-                            
-                            total_downloaded += 1
-                            print(f"  ✓ 下载成功: {filename} ({len(response.content)} bytes)")
-                            
-                        except Exception as verify_error:
-                            print(f"  ✗ 图像验证失败: {verify_error}")
-                            filepath.unlink()  # 删除无效文件
-                            
-                    else:
-                        print(f"  ✗ HTTP错误 {response.status_code}: {url}")
-                        
-                    time.sleep(1)  # 礼貌性延迟
+                    self.metadata.append({
+                        "filename": filename,
+                        "source": source_name,
+                        "url": url,
+                        "type": "ishihara_real",
+                        "file_size": file_size,
+                        "content_type": content_type
+                    })
                     
-                except Exception as e:
-                    print(f"  ✗ 下载失败: {e}")
+                    total_downloaded += 1
+                    print(f"  ✓ 下载成功: {filename} ({file_size} bytes)")
                     
+                except Exception as verify_error:
+                    print(f"  ✗ 图像验证失败: {verify_error}")
+                    filepath.unlink()  # 删除无效文件
+                
+            except Exception as e:
+                print(f"  ✗ 下载失败: {e}")
+        
+        self.discard_parts(results)
         return total_downloaded
 
     def search_additional_sources(self):
@@ -182,10 +302,8 @@ class RealIshiharaDownloader:
         
         return downloaded
 
-    def download_wiki_commons_systematically(self):
-        """系统性地从Wikimedia Commons下载"""
-        print("\n正在系统性地从Wikimedia Commons下载...")
-        
+    def wiki_commons_urls(self):
+        """Wikimedia Commons上已知测试图的(文件名, URL)列表"""
         # 构建更全面的Wikimedia Commons URL列表
         base_url = "https://upload.wikimedia.org/wikipedia/commons"
         
@@ -208,41 +326,55 @@ class RealIshiharaDownloader:
             ("a/a6", "Color_blindness_test_2.jpg"),
         ]
         
+        return [(filename, f"{base_url}/{path}/{filename}") for path, filename in known_patterns]
+
+    def download_wiki_commons_systematically(self, results=None):
+        """系统性地从Wikimedia Commons下载
+        
+        Args:
+            results: wiki_commons_urls对应的fetch_all结果；为None时在此处并发下载
+        """
+        print("\n正在系统性地从Wikimedia Commons下载...")
+        
+        patterns = self.wiki_commons_urls()
+        if results is None:
+            results = self.fetch_all([url for _, url in patterns])
+        
         downloaded = 0
-        for path, filename in known_patterns:
+        for (filename, url), (fetched, error) in zip(patterns, results):
             if len(self.metadata) >= 100:
                 break
-                
-            url = f"{base_url}/{path}/{filename}"
+            
+            print(f"  尝试下载: {filename}")
+            if error is not None:
+                print(f"  ✗ 下载失败 {filename}: {error}")
+                continue
+            
+            status_code, part_path, file_size, _ = fetched
+            if status_code != 200:
+                print(f"  ✗ 文件不存在: {filename}")
+                continue
+            
             try:
-                print(f"  尝试下载: {filename}")
-                response = self.session.get(url, timeout=30)
+                filepath = self.base_dir / f"wikimedia_{downloaded+1:03d}_{filename}"
                 
-                if response.status_code == 200:
-                    filepath = self.base_dir / f"wikimedia_{downloaded+1:03d}_{filename}"
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(response.content)
-                    
-                    self.metadata.append({
-                        "filename": filepath.name,
-                        "source": "Wikimedia Commons Systematic",
-                        "url": url,
-                        "type": "ishihara_real",
-                        "file_size": len(response.content)
-                    })
-                    
-                    downloaded += 1
-                    print(f"  ✓ 下载成功: {filepath.name}")
-                    
-                else:
-                    print(f"  ✗ 文件不存在: {filename}")
-                    
-                time.sleep(1)
+                part_path.replace(filepath)
+                
+                self.metadata.append({
+                    "filename": filepath.name,
+                    "source": "Wikimedia Commons Systematic",
+                    "url": url,
+                    "type": "ishihara_real",
+                    "file_size": file_size
+                })
+                
+                downloaded += 1
+                print(f"  ✓ 下载成功: {filepath.name}")
                 
             except Exception as e:
                 print(f"  ✗ 下载失败 {filename}: {e}")
-                
+        
+        self.discard_parts(results)
         return downloaded
 
     def save_metadata(self, metadata_file="metadata/real_images_metadata.json"):
@@ -269,14 +401,20 @@ class RealIshiharaDownloader:
         
         total_downloaded = 0
         
+        # 方法1和方法2的所有URL一次性并发下载，之后在主线程中按顺序校验和保存
+        sources = self.multiple_source_urls()
+        patterns = self.wiki_commons_urls()
+        print(f"并发下载 {len(sources) + len(patterns)} 个URL...")
+        results = self.fetch_all([url for _, url in sources] + [url for _, url in patterns])
+        
         # 方法1: 从多个来源下载
-        downloaded = self.download_from_multiple_sources()
+        downloaded = self.download_from_multiple_sources(results[:len(sources)])
         total_downloaded += downloaded
         print(f"第一阶段下载: {downloaded} 张")
         
         # 方法2: 系统性地从Wikimedia Commons下载
         if total_downloaded < 100:
-            downloaded = self.download_wiki_commons_systematically()
+            downloaded = self.download_wiki_commons_systematically(results[len(sources):])
             total_downloaded += downloaded
             print(f"第二阶段下载: {downloaded} 张")
         
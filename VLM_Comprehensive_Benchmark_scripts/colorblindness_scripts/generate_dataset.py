@@ -4,23 +4,196 @@
 整合下载、模拟和梯度生成的完整流程
 """
 
+import argparse
+import hashlib
 import os
 import sys
-import json
+import multiprocessing
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PIL import Image
 import numpy as np
 
+try:
+    from numba import set_num_threads
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 # 添加当前目录到路径，以便导入其他模块
 sys.path.append(str(Path(__file__).parent))
 
 from download_ishihara_plates import IshiharaDownloader
-from colorblind_simulation import ColorBlindnessSimulator, ColorBlindnessMetrics
+from colorblind_simulation import ColorBlindnessSimulator, ColorBlindnessMetrics, GRADIENT_SAVE_OPTIONS, gpu_available
+from io_utils import json_dumps, json_loads
+
+
+# 工作进程内的模拟器和指标计算器，由_init_worker在每个进程中构建一次
+_simulator = None
+_metrics = None
+
+
+def _init_worker(numba_threads=None):
+    """进程池初始化函数：构建模拟器（含预计算的查找表），避免跨进程序列化
+    
+    Args:
+        numba_threads: 限制本进程JIT内核的线程数；进程池已按CPU核数并行时传1，避免线程数超额
+    """
+    global _simulator, _metrics
+    if NUMBA_AVAILABLE and numba_threads is not None:
+        set_num_threads(numba_threads)
+    _simulator = ColorBlindnessSimulator()
+    _metrics = ColorBlindnessMetrics()
+
+
+def _existing_frames(directory, min_size=100):
+    """单次遍历目录，返回已存在且大于min_size字节的文件名集合"""
+    with os.scandir(directory) as entries:
+        return {
+            entry.name for entry in entries
+            if entry.is_file() and entry.stat().st_size > min_size
+        }
+
+
+def _process_one_image(image_path, gradients_dir, colorblind_types, gradient_steps,
+                       output_format='png', matrices=None, cached_thresholds=None, use_gpu=False,
+                       force=False):
+    """为一张基础图像生成所有色盲类型的梯度序列，供进程池调用
+    
+    Args:
+        output_format: 梯度图像格式，GRADIENT_SAVE_OPTIONS中的键
+        matrices: ColorBlindnessSimulator.severity_matrices的结果；为None时在此处计算
+        cached_thresholds: {色盲类型: 可见性阈值}，命中的类型不再重新计算
+        use_gpu: 是否在GPU上生成梯度帧
+        force: 为True时重新生成所有帧；否则跳过已存在的帧文件
+    
+    Returns:
+        (图像元数据, 生成的文件数)；处理失败时返回(None, 0)
+    """
+    if _simulator is None:
+        _init_worker()
+    
+    if matrices is None:
+        matrices = _simulator.severity_matrices(colorblind_types, gradient_steps)
+    
+    image_file = Path(image_path)
+    gradients_dir = Path(gradients_dir)
+    save_options = GRADIENT_SAVE_OPTIONS[output_format]
+    cached_thresholds = cached_thresholds or {}
+    total_generated = 0
+    
+    try:
+        # 加载并验证图像
+        image = Image.open(image_file).convert('RGB')
+        print(f"  {image_file.name} 图像尺寸: {image.size}")
+        
+        # 只转换一次为数组，所有色盲类型和严重程度复用
+        img_arr = np.asarray(image, dtype=np.uint8)
+        
+        # 为每种色盲类型生成梯度
+        image_metadata = {
+            "base_image": image_file.name,
+            "base_image_path": str(image_file),
+            "image_size": image.size,
+            "colorblind_variants": {}
+        }
+        
+        for colorblind_type in colorblind_types:
+            # 创建输出目录
+            type_output_dir = gradients_dir / image_file.stem / colorblind_type
+            type_output_dir.mkdir(parents=True, exist_ok=True)
+            
+            # 生成梯度序列
+            type_matrices = matrices[colorblind_type]
+            filenames = [
+                f"step_{step:03d}_severity_{step / gradient_steps:.2f}.{output_format}"
+                for step in range(gradient_steps + 1)
+            ]
+            # 元数据只记录文件名，完整路径为 output_directory / 文件名
+            generated_files = filenames
+            contrast_analyses = []
+            original_contrast = None
+            
+            # 上次运行已生成的帧不再保存；只计算缺失的帧和对比度分析所需的帧
+            existing = set() if force else _existing_frames(type_output_dir)
+            steps = [
+                step for step, filename in enumerate(filenames)
+                if filename not in existing or step % 10 == 0
+            ]
+            
+            for step, out_arr in zip(steps, _simulator.iter_severity_frames(img_arr, type_matrices[steps], use_gpu)):
+                severity = step / gradient_steps
+                filepath = type_output_dir / filenames[step]
+                
+                # 保存图像
+                if filenames[step] not in existing:
+                    Image.fromarray(out_arr).save(filepath, **save_options)
+                
+                # 每10步分析一次对比度，直接使用刚生成的帧，不再重新模拟
+                if step % 10 == 0:
+                    contrast_analysis = _simulator.analyze_from_arrays(
+                        img_arr, out_arr, original_contrast
+                    )
+                    original_contrast = contrast_analysis["original_contrast"]
+                    contrast_analysis["colorblind_type"] = colorblind_type
+                    contrast_analysis["severity"] = severity
+                    contrast_analysis["step"] = step
+                    contrast_analysis["filepath"] = str(filepath)
+                    contrast_analyses.append(contrast_analysis)
+            
+            # 计算可见性阈值（相同内容的图像之前已计算过时直接复用）
+            if colorblind_type in cached_thresholds:
+                visibility_threshold = cached_thresholds[colorblind_type]
+            else:
+                try:
+                    visibility_threshold = float(_metrics.calculate_visibility_threshold(
+                        img_arr, colorblind_type
+                    ))
+                except Exception as e:
+                    print(f"    警告: {image_file.name} {colorblind_type} 无法计算可见性阈值: {e}")
+                    visibility_threshold = None
+            
+            variant_metadata = {
+                "colorblind_type": colorblind_type,
+                "generated_files": generated_files,
+                "num_gradients": len(generated_files),
+                "contrast_analyses": contrast_analyses,
+                "visibility_threshold": visibility_threshold,
+                "output_directory": str(type_output_dir)
+            }
+            
+            image_metadata["colorblind_variants"][colorblind_type] = variant_metadata
+            total_generated += len(generated_files)
+            
+            print(f"    ✓ {image_file.name} {colorblind_type}: 生成了 {len(generated_files)} 个梯度文件")
+            if visibility_threshold is not None:
+                print(f"    可见性阈值: {visibility_threshold:.2f}")
+        
+        return image_metadata, total_generated
+        
+    except Exception as e:
+        print(f"  ✗ {image_file.name} 处理失败: {e}")
+        return None, 0
+
 
 class ColorBlindnessDatasetGenerator:
-    def __init__(self, base_dir=".."):
-        """初始化数据集生成器"""
+    def __init__(self, base_dir="..", output_format='png', device='auto', force=False):
+        """初始化数据集生成器
+        
+        Args:
+            base_dir: 数据集根目录
+            output_format: 梯度图像格式 ('png' 或 'webp')
+            device: 'auto'（有CUDA设备时使用GPU）、'cuda' 或 'cpu'
+            force: 为True时重新生成所有梯度帧，否则跳过已存在的帧文件
+        """
+        if output_format not in GRADIENT_SAVE_OPTIONS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        if device not in ('auto', 'cuda', 'cpu'):
+            raise ValueError(f"不支持的设备: {device}")
+        if device == 'cuda' and not gpu_available():
+            raise RuntimeError("未检测到可用的CUDA设备（需要安装cupy）")
+        
         self.base_dir = Path(base_dir)
         self.raw_dir = self.base_dir / "data" / "raw"
         self.processed_dir = self.base_dir / "data" / "processed"
@@ -38,6 +211,20 @@ class ColorBlindnessDatasetGenerator:
         # 色盲类型配置
         self.colorblind_types = ['protanopia', 'deuteranopia', 'tritanopia']
         self.gradient_steps = 100
+        self.output_format = output_format
+        self.use_gpu = device == 'cuda' or (device == 'auto' and gpu_available())
+        self.force = force
+        
+        # 各严重程度的变换矩阵只计算一次，由所有图像共用
+        self.matrices = self.simulator.severity_matrices(self.colorblind_types, self.gradient_steps)
+    
+    def list_raw_images(self, extensions):
+        """单次遍历raw_dir，返回扩展名（小写，含点）属于extensions的文件"""
+        with os.scandir(self.raw_dir) as entries:
+            return [
+                Path(entry.path) for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions
+            ]
     
     def step1_download_base_images(self):
         """步骤1: 下载基础图像"""
@@ -45,20 +232,21 @@ class ColorBlindnessDatasetGenerator:
         self.downloader.run()
         
         # 检查下载结果
-        image_files = list(self.raw_dir.glob("*.png")) + list(self.raw_dir.glob("*.jpg"))
+        image_files = self.list_raw_images({'.png', '.jpg'})
         print(f"获得 {len(image_files)} 张基础图像")
         return len(image_files) >= 100  # 必须要有100张真实网络图像
     
-    def step2_generate_gradients(self):
-        """步骤2: 为每张基础图像生成色盲模拟梯度"""
+    def step2_generate_gradients(self, max_workers=None):
+        """步骤2: 为每张基础图像生成色盲模拟梯度
+        
+        Args:
+            max_workers: 并行处理图像的进程数，默认为CPU核数（使用GPU时默认为2）
+        """
         print("=== 步骤2: 生成色盲模拟梯度 ===")
         
         # 获取所有基础图像
         image_extensions = {'.png', '.jpg', '.jpeg', '.bmp'}
-        base_images = []
-        
-        for ext in image_extensions:
-            base_images.extend(self.raw_dir.glob(f"*{ext}"))
+        base_images = self.list_raw_images(image_extensions)
         
         if not base_images:
             print("错误: 没有找到基础图像")
@@ -67,104 +255,78 @@ class ColorBlindnessDatasetGenerator:
         print(f"找到 {len(base_images)} 张基础图像")
         
         total_generated = 0
-        dataset_metadata = {
+        processed_images = 0
+        dataset_summary = {
             "generation_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
             "total_base_images": len(base_images),
             "colorblind_types": self.colorblind_types,
-            "gradient_steps": self.gradient_steps,
-            "images": []
+            "gradient_steps": self.gradient_steps
         }
         
-        for i, image_file in enumerate(base_images):
-            print(f"\n处理图像 {i+1}/{len(base_images)}: {image_file.name}")
-            
-            try:
-                # 加载并验证图像
-                image = Image.open(image_file).convert('RGB')
-                print(f"  图像尺寸: {image.size}")
-                
-                # 为每种色盲类型生成梯度
-                image_metadata = {
-                    "base_image": image_file.name,
-                    "base_image_path": str(image_file),
-                    "image_size": image.size,
-                    "colorblind_variants": {}
-                }
-                
-                for colorblind_type in self.colorblind_types:
-                    print(f"  生成 {colorblind_type} 梯度...")
-                    
-                    # 创建输出目录
-                    type_output_dir = self.gradients_dir / image_file.stem / colorblind_type
-                    type_output_dir.mkdir(parents=True, exist_ok=True)
-                    
-                    # 生成梯度序列
-                    generated_files = []
-                    contrast_analyses = []
-                    
-                    for step in range(self.gradient_steps + 1):
-                        severity = step / self.gradient_steps
-                        
-                        # 应用色盲模拟
-                        sim_func = getattr(self.simulator, f'simulate_{colorblind_type}')
-                        simulated_image = sim_func(image, severity)
-                        
-                        # 保存图像
-                        filename = f"step_{step:03d}_severity_{severity:.2f}.png"
-                        filepath = type_output_dir / filename
-                        simulated_image.save(filepath)
-                        generated_files.append(str(filepath))
-                        
-                        # 每10步分析一次对比度
-                        if step % 10 == 0:
-                            contrast_analysis = self.simulator.analyze_color_contrast(
-                                image, colorblind_type, severity
-                            )
-                            contrast_analysis["step"] = step
-                            contrast_analysis["filepath"] = str(filepath)
-                            contrast_analyses.append(contrast_analysis)
-                    
-                    # 计算可见性阈值
-                    try:
-                        visibility_threshold = self.metrics.calculate_visibility_threshold(
-                            image, colorblind_type
-                        )
-                    except Exception as e:
-                        print(f"    警告: 无法计算可见性阈值: {e}")
-                        visibility_threshold = None
-                    
-                    variant_metadata = {
-                        "colorblind_type": colorblind_type,
-                        "generated_files": generated_files,
-                        "num_gradients": len(generated_files),
-                        "contrast_analyses": contrast_analyses,
-                        "visibility_threshold": visibility_threshold,
-                        "output_directory": str(type_output_dir)
-                    }
-                    
-                    image_metadata["colorblind_variants"][colorblind_type] = variant_metadata
-                    total_generated += len(generated_files)
-                    
-                    print(f"    ✓ 生成了 {len(generated_files)} 个梯度文件")
-                    if visibility_threshold is not None:
-                        print(f"    可见性阈值: {visibility_threshold:.2f}")
-                
-                dataset_metadata["images"].append(image_metadata)
+        # 可见性阈值缓存，键为 图像内容SHA-1:色盲类型，重复运行或重复图像不再计算
+        cache_file = self.metadata_dir / ".vt_cache.json"
+        threshold_cache = json_loads(cache_file.read_bytes()) if cache_file.exists() else {}
+        image_hashes = [hashlib.sha1(image_file.read_bytes()).hexdigest() for image_file in base_images]
+        cached_thresholds = [
+            {
+                cb_type: threshold_cache[f"{image_hash}:{cb_type}"]
+                for cb_type in self.colorblind_types
+                if f"{image_hash}:{cb_type}" in threshold_cache
+            }
+            for image_hash in image_hashes
+        ]
+        
+        # 每张图像相互独立，按图像分发到多个进程；map保持原有的图像顺序。
+        # 使用GPU时本进程已初始化CUDA，fork出的子进程无法再使用CUDA，改用spawn启动少量进程，
+        # 每个进程各自建立CUDA上下文
+        if self.use_gpu:
+            pool_options = dict(max_workers=max_workers or min(2, os.cpu_count()),
+                                mp_context=multiprocessing.get_context('spawn'))
+        else:
+            pool_options = dict(max_workers=max_workers or os.cpu_count())
+        
+        # 每张图像完成后立即追加一行元数据，内存中不保留全部图像的元数据
+        metadata_file = self.metadata_dir / "complete_dataset.jsonl"
+        with open(metadata_file, 'wb', buffering=1024 * 1024) as out, \
+                ProcessPoolExecutor(initializer=_init_worker, initargs=(1,), **pool_options) as executor:
+            results = executor.map(
+                _process_one_image,
+                [str(image_file) for image_file in base_images],
+                [str(self.gradients_dir)] * len(base_images),
+                [self.colorblind_types] * len(base_images),
+                [self.gradient_steps] * len(base_images),
+                [self.output_format] * len(base_images),
+                [self.matrices] * len(base_images),
+                cached_thresholds,
+                [self.use_gpu] * len(base_images),
+                [self.force] * len(base_images)
+            )
+            for i, (image_file, (image_metadata, generated)) in enumerate(zip(base_images, results)):
+                if image_metadata is None:
+                    continue
+                print(f"完成图像 {i+1}/{len(base_images)}: {image_file.name}")
+                out.write(json_dumps(image_metadata) + b'\n')
+                processed_images += 1
+                total_generated += generated
                 
-            except Exception as e:
-                print(f"  ✗ 处理失败: {e}")
-                continue
-        
-        # 保存数据集元数据
-        metadata_file = self.metadata_dir / "complete_dataset.json"
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(dataset_metadata, f, indent=2, ensure_ascii=False)
-        
-        # 生成数据集统计
-        stats = self.generate_dataset_statistics(dataset_metadata)
+                # 每张图像完成后写回缓存
+                for cb_type, variant_meta in image_metadata["colorblind_variants"].items():
+                    if variant_meta["visibility_threshold"] is not None:
+                        threshold_cache[f"{image_hashes[i]}:{cb_type}"] = variant_meta["visibility_threshold"]
+                cache_file.write_bytes(json_dumps(threshold_cache))
+        
+        # 汇总文件只包含计数
+        dataset_summary["processed_images"] = processed_images
+        dataset_summary["total_gradient_images"] = total_generated
+        summary_file = self.metadata_dir / "dataset_summary.json"
+        summary_file.write_bytes(json_dumps(dataset_summary, indent=True))
+        
+        # 生成数据集统计（逐行读取图像元数据）
+        stats = self.generate_dataset_statistics(
+            dict(dataset_summary, images=self.iter_image_metadata())
+        )
         stats_file = self.metadata_dir / "dataset_statistics.json"
-        with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, indent=2, ensure_ascii=False)
+        stats_file.write_bytes(json_dumps(stats, indent=True))
         
         print(f"\n=== 梯度生成完成 ===")
         print(f"总共生成: {total_generated} 张图像")
@@ -173,8 +335,20 @@ class ColorBlindnessDatasetGenerator:
         
         return total_generated > 0
     
+    def iter_image_metadata(self):
+        """逐行读取complete_dataset.jsonl，每次产生一张基础图像的元数据"""
+        metadata_file = self.metadata_dir / "complete_dataset.jsonl"
+        with open(metadata_file, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield json_loads(line)
+    
     def generate_dataset_statistics(self, metadata):
-        """生成数据集统计信息"""
+        """生成数据集统计信息
+        
+        Args:
+            metadata: 数据集汇总信息，其中"images"为图像元数据的可迭代对象
+        """
         stats = {
             "dataset_overview": {
                 "total_base_images": metadata["total_base_images"],
@@ -187,14 +361,19 @@ class ColorBlindnessDatasetGenerator:
             "contrast_analysis_summary": {}
         }
         
+        # 预分配数组按索引填充，不为每个数值追加Python列表元素；
+        # 容量上限为每张图像每种类型一个阈值、每10步一次对比度分析
+        num_images = metadata["total_base_images"]
+        max_analyses = num_images * (metadata["gradient_steps"] // 10 + 1)
+        thresholds = {cb_type: np.empty(num_images) for cb_type in self.colorblind_types}
+        color_differences = {cb_type: np.empty(max_analyses) for cb_type in self.colorblind_types}
+        contrast_changes = {cb_type: np.empty(max_analyses) for cb_type in self.colorblind_types}
+        num_thresholds = dict.fromkeys(self.colorblind_types, 0)
+        num_analyses = dict.fromkeys(self.colorblind_types, 0)
+        
         # 统计每种色盲类型的图像数量
         for cb_type in self.colorblind_types:
             stats["images_per_type"][cb_type] = 0
-            stats["visibility_thresholds"][cb_type] = []
-            stats["contrast_analysis_summary"][cb_type] = {
-                "avg_color_difference": [],
-                "avg_contrast_change": []
-            }
         
         # 遍历所有图像计算统计
         for image_meta in metadata["images"]:
@@ -205,40 +384,33 @@ class ColorBlindnessDatasetGenerator:
                 
                 # 可见性阈值
                 if variant_meta["visibility_threshold"] is not None:
-                    stats["visibility_thresholds"][cb_type].append(
-                        variant_meta["visibility_threshold"]
-                    )
+                    thresholds[cb_type][num_thresholds[cb_type]] = variant_meta["visibility_threshold"]
+                    num_thresholds[cb_type] += 1
                 
                 # 对比度分析
+                k = num_analyses[cb_type]
                 for analysis in variant_meta["contrast_analyses"]:
-                    stats["contrast_analysis_summary"][cb_type]["avg_color_difference"].append(
-                        analysis["color_difference"]
-                    )
-                    stats["contrast_analysis_summary"][cb_type]["avg_contrast_change"].append(
-                        analysis["contrast_change"]
-                    )
+                    color_differences[cb_type][k] = analysis["color_difference"]
+                    contrast_changes[cb_type][k] = analysis["contrast_change"]
+                    k += 1
+                num_analyses[cb_type] = k
         
-        # 计算平均值
+        # 计算平均值（无数据时保持空列表）
         for cb_type in self.colorblind_types:
-            if stats["visibility_thresholds"][cb_type]:
-                stats["visibility_thresholds"][cb_type] = {
-                    "mean": np.mean(stats["visibility_thresholds"][cb_type]),
-                    "std": np.std(stats["visibility_thresholds"][cb_type]),
-                    "min": np.min(stats["visibility_thresholds"][cb_type]),
-                    "max": np.max(stats["visibility_thresholds"][cb_type])
-                }
+            values = thresholds[cb_type][:num_thresholds[cb_type]]
+            stats["visibility_thresholds"][cb_type] = {
+                "mean": values.mean(),
+                "std": values.std(),
+                "min": values.min(),
+                "max": values.max()
+            } if values.size else []
             
-            summary = stats["contrast_analysis_summary"][cb_type]
-            if summary["avg_color_difference"]:
-                summary["avg_color_difference"] = {
-                    "mean": np.mean(summary["avg_color_difference"]),
-                    "std": np.std(summary["avg_color_difference"])
-                }
-            if summary["avg_contrast_change"]:
-                summary["avg_contrast_change"] = {
-                    "mean": np.mean(summary["avg_contrast_change"]),
-                    "std": np.std(summary["avg_contrast_change"])
-                }
+            summary = {}
+            for key, data in (("avg_color_difference", color_differences),
+                              ("avg_contrast_change", contrast_changes)):
+                values = data[cb_type][:num_analyses[cb_type]]
+                summary[key] = {"mean": values.mean(), "std": values.std()} if values.size else []
+            stats["contrast_analysis_summary"][cb_type] = summary
         
         return stats
     
@@ -249,22 +421,25 @@ class ColorBlindnessDatasetGenerator:
         test_cases = []
         
         # 读取数据集元数据
-        metadata_file = self.metadata_dir / "complete_dataset.json"
+        metadata_file = self.metadata_dir / "complete_dataset.jsonl"
         if not metadata_file.exists():
             print("错误: 找不到数据集元数据文件")
             return False
         
-        with open(metadata_file, 'r', encoding='utf-8') as f:
-            dataset_metadata = json.load(f)
-        
-        # 为每个基础图像创建测试用例
-        for image_meta in dataset_metadata["images"]:
+        # 为每个基础图像创建测试用例（逐行读取元数据）
+        for image_meta in self.iter_image_metadata():
             base_image = image_meta["base_image"]
             
             # 确定期望的答案（基于文件名或元数据）
             expected_answer = self.extract_expected_answer(base_image)
             
             for cb_type, variant_meta in image_meta["colorblind_variants"].items():
+                # 元数据中只有文件名，测试用例中给出完整路径
+                output_directory = Path(variant_meta["output_directory"])
+                gradient_files = [
+                    str(output_directory / filename) for filename in variant_meta["generated_files"]
+                ]
+                
                 # 创建测试序列
                 test_sequence = {
                     "test_id": f"{Path(base_image).stem}_{cb_type}",
@@ -272,7 +447,7 @@ class ColorBlindnessDatasetGenerator:
                     "colorblind_type": cb_type,
                     "expected_answer": expected_answer,
                     "test_description": f"测试模型在{cb_type}模拟下识别{expected_answer}的能力",
-                    "gradient_files": variant_meta["generated_files"],
+                    "gradient_files": gradient_files,
                     "num_gradients": variant_meta["num_gradients"],
                     "visibility_threshold": variant_meta["visibility_threshold"],
                     "test_questions": []
@@ -281,12 +456,12 @@ class ColorBlindnessDatasetGenerator:
                 # 为关键梯度点创建测试问题
                 key_steps = [0, 25, 50, 75, 100]  # 关键测试点
                 for step in key_steps:
-                    if step < len(variant_meta["generated_files"]):
+                    if step < len(gradient_files):
                         severity = step / 100.0
                         test_question = {
                             "step": step,
                             "severity": severity,
-                            "image_path": variant_meta["generated_files"][step],
+                            "image_path": gradient_files[step],
                             "question": f"这张图中显示的是什么数字或符号？",
                             "expected_answer": expected_answer,
                             "difficulty_level": self.assess_difficulty_level(severity, variant_meta["visibility_threshold"])
@@ -297,12 +472,11 @@ class ColorBlindnessDatasetGenerator:
         
         # 保存测试用例
         test_cases_file = self.metadata_dir / "test_cases.json"
-        with open(test_cases_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                "total_test_sequences": len(test_cases),
-                "creation_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                "test_sequences": test_cases
-            }, f, indent=2, ensure_ascii=False)
+        test_cases_file.write_bytes(json_dumps({
+            "total_test_sequences": len(test_cases),
+            "creation_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "test_sequences": test_cases
+        }, indent=True))
         
         print(f"创建了 {len(test_cases)} 个测试序列")
         print(f"测试用例保存到: {test_cases_file}")
@@ -361,7 +535,8 @@ colorblindness/
 │           ├── deuteranopia/  # 绿色盲模拟 (101张图像, 0%-100%严重程度)  
 │           └── tritanopia/    # 蓝色盲模拟 (101张图像, 0%-100%严重程度)
 ├── metadata/
-│   ├── complete_dataset.json     # 完整数据集元数据
+│   ├── complete_dataset.jsonl    # 完整数据集元数据（每行一张基础图像）
+│   ├── dataset_summary.json      # 数据集生成汇总
 │   ├── dataset_statistics.json   # 数据集统计信息
 │   └── test_cases.json          # 测试用例定义
 ├── scripts/
@@ -461,8 +636,7 @@ colorblindness/
         try:
             stats_file = self.metadata_dir / "dataset_statistics.json"
             if stats_file.exists():
-                with open(stats_file, 'r', encoding='utf-8') as f:
-                    stats = json.load(f)
+                stats = json_loads(stats_file.read_bytes())
                 
                 overview = stats["dataset_overview"]
                 print(f"\n数据集统计:")
@@ -480,8 +654,18 @@ colorblindness/
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="色盲测试数据集生成器")
+    parser.add_argument("--format", choices=sorted(GRADIENT_SAVE_OPTIONS), default="png",
+                        help="梯度图像格式（webp编码更快、文件更小）")
+    parser.add_argument("--device", choices=["auto", "cuda", "cpu"], default="auto",
+                        help="梯度帧的计算设备（auto: 有CUDA设备时使用GPU）")
+    parser.add_argument("--force", action="store_true",
+                        help="重新生成所有梯度帧（默认跳过已存在的帧文件）")
+    args = parser.parse_args()
+    
     # 创建生成器并运行
-    generator = ColorBlindnessDatasetGenerator()
+    generator = ColorBlindnessDatasetGenerator(output_format=args.format, device=args.device,
+                                               force=args.force)
     success = generator.run_complete_generation()
     
     if success:
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+下载器、模拟器和数据集生成脚本共用的JSON序列化与流式写盘工具
+"""
+
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_default(obj):
+    """stdlib json回退路径中序列化NumPy标量和数组"""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+def json_loads(data):
+    """解析JSON字节串（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj, indent=False):
+    """将对象序列化为UTF-8 JSON字节串（优先使用orjson），NumPy标量和数组直接序列化"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False, default=json_default).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=json_default).encode('utf-8')
+
+
+def save_stream(response, filepath, digest=None, chunk_size=64 * 1024):
+    """把requests的流式响应体写入文件，不在内存中保留完整内容
+
+    服务器使用gzip等传输编码时写入解码后的内容；写入失败时删除写了一半的文件。
+
+    Args:
+        response: 以stream=True发起请求得到的响应
+        filepath: 目标文件路径
+        digest: 可选的hashlib对象，写入的同时用文件内容更新
+        chunk_size: 每次读取的字节数
+
+    Returns:
+        写入的字节数
+    """
+    response.raw.decode_content = True
+    try:
+        with open(filepath, 'wb') as f:
+            if digest is None:
+                shutil.copyfileobj(response.raw, f, length=chunk_size)
+            else:
+                while True:
+                    chunk = response.raw.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    digest.update(chunk)
+            return f.tell()
+    except Exception:
+        Path(filepath).unlink(missing_ok=True)
+        raise
+
+
+def read_jsonl(path, key=None):
+    """读取追加写入的JSONL日志
+
+    Args:
+        path: JSONL文件路径，不存在时返回空列表
+        key: 可选的函数，从记录中取出唯一键；同一键只保留最后一条记录
+            （重复运行会覆盖同名输出，旧记录已失效）
+
+    Returns:
+        记录列表
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path, 'rb') as f:
+        records = [json_loads(line) for line in f if line.strip()]
+    if key is None:
+        return records
+    latest = {}
+    for record in records:
+        latest[key(record)] = record
+    return list(latest.values())
@@ -5,39 +5,69 @@
 """
 
 import json
+import re
+import logging
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from pathlib import Path
 import random
-from typing import Tuple
+from typing import Tuple, Optional
+
+from answer_extraction import extract_answer
+import matplotlib
+matplotlib.use("Agg")  # 只输出文件，不需要GUI后端
 import matplotlib.pyplot as plt
 
-def simulate_model_prediction(image_path: str, model_type: str = "robust") -> Tuple[str, float]:
+# 逐步骤的预测明细走日志，默认不输出（--verbose开启）
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# 文件名解析用的预编译正则
+_SEV_RE = re.compile(r'severity_(\d+\.\d+)')
+
+# 错误预测的候选答案：按真实答案预先排除，避免每次重建列表
+_WRONG = ("1", "2", "3", "5", "6", "8", "9", "circle", "square")
+_WRONG_BY_TRUE = {t: tuple(x for x in _WRONG if x != t) for t in _WRONG}
+
+# 模拟预测专用的随机数生成器；未传入rng_row时从这里取随机数
+_np_rng = np.random.default_rng()
+
+# 每次模拟预测使用的随机数个数：[噪声, 置信度扰动, 是否正确, 错误答案选择]
+N_RANDOM_PER_PREDICTION = 4
+
+def simulate_model_prediction(image_path: str, model_type: str = "robust",
+                              rng_row=None, true_answer: Optional[str] = None) -> Tuple[str, float]:
     """
     模拟不同类型模型的预测行为
     
     Args:
         image_path: 图像路径
         model_type: 模型类型 ("robust", "fragile", "inconsistent")
+        rng_row: 预先批量生成的N_RANDOM_PER_PREDICTION个[0, 1)随机数，None时现场生成
+        true_answer: 调用方已确定的真实答案，None时从文件名提取
     
     Returns:
         (预测结果, 置信度)
     """
     # 从文件名提取真实答案
     filename = Path(image_path).name
+    if true_answer is None:
+        true_answer = extract_true_answer(filename)
     if "severity_0.00" in filename:
         # 正常图像，所有模型都应该能识别
-        true_answer = extract_true_answer(filename)
         return true_answer, 0.95
     
     # 从文件名提取严重程度
-    import re
-    severity_match = re.search(r'severity_(\d+\.\d+)', filename)
+    severity_match = _SEV_RE.search(filename)
     if severity_match:
         severity = float(severity_match.group(1))
     else:
         severity = 0.0
     
-    true_answer = extract_true_answer(filename)
+    if rng_row is None:
+        rng_row = _np_rng.random(N_RANDOM_PER_PREDICTION)
     
     # 根据模型类型和严重程度模拟预测
     if model_type == "robust":
@@ -53,35 +83,32 @@ def simulate_model_prediction(image_path: str, model_type: str = "robust") -> Tu
     elif model_type == "inconsistent":
         # 不一致模型：表现不稳定
         base_success = max(0.1, 1.0 - severity)
-        noise = random.uniform(-0.3, 0.3)
+        noise = float(rng_row[0]) * 0.6 - 0.3  # [-0.3, 0.3)
         success_prob = max(0.05, min(0.95, base_success + noise))
-        confidence = max(0.2, min(0.9, success_prob + random.uniform(-0.2, 0.2)))
+        confidence = max(0.2, min(0.9, success_prob + float(rng_row[1]) * 0.4 - 0.2))
     
     else:
         success_prob = 0.5
         confidence = 0.5
     
     # 决定是否预测正确
-    if random.random() < success_prob:
+    if rng_row[2] < success_prob:
         prediction = true_answer
     else:
         # 错误预测
-        wrong_answers = ["1", "2", "3", "5", "6", "8", "9", "circle", "square"]
-        prediction = random.choice([ans for ans in wrong_answers if ans != true_answer])
+        candidates = _WRONG_BY_TRUE.get(true_answer, _WRONG)
+        prediction = candidates[int(rng_row[3] * len(candidates))]
     
     return prediction, confidence
 
+@functools.lru_cache(maxsize=4096)
 def extract_true_answer(filename: str) -> str:
-    """从文件名提取真实答案"""
-    # 简化的答案提取逻辑
-    if "learning" in filename:
-        # 从GitHub学习数据集的文件名提取
-        import re
-        numbers = re.findall(r'_(\d+)_', filename)
-        if numbers:
-            return numbers[0]
+    """从文件名提取真实答案（按文件名缓存，同一图像多次调用结果一致）"""
+    answer = extract_answer(filename)
+    if answer != "unknown":
+        return answer
     
-    # 其他规则...
+    # 无法确定答案时随机指定一个
     return random.choice(["8", "3", "5", "2", "6"])
 
 def run_quick_demo():
@@ -101,6 +128,8 @@ def run_quick_demo():
         if image_dir.is_dir():
             protanopia_dir = image_dir / "protanopia"
             if protanopia_dir.exists():
+                # 真实答案由基础图像名决定，每张基础图像只提取一次
+                true_answer = extract_true_answer(image_dir.name)
                 # 选择几个关键严重程度的图像
                 key_steps = [0, 25, 50, 75, 100]
                 for step in key_steps:
@@ -110,7 +139,8 @@ def run_quick_demo():
                             "path": str(image_file),
                             "severity": step / 100,
                             "colorblind_type": "protanopia",
-                            "base_image": image_dir.name
+                            "base_image": image_dir.name,
+                            "true_answer": true_answer
                         })
                 break  # 只用一张基础图像做演示
     
@@ -123,6 +153,7 @@ def run_quick_demo():
     # 测试三种不同类型的模型
     model_types = ["robust", "fragile", "inconsistent"]
     results = {}
+    rng = np.random.default_rng(0)
     
     for model_type in model_types:
         print(f"\n📊 测试 {model_type} 模型...")
@@ -134,9 +165,13 @@ def run_quick_demo():
             "severities": []
         }
         
-        for img_info in demo_images:
-            prediction, confidence = simulate_model_prediction(img_info["path"], model_type)
-            true_answer = extract_true_answer(Path(img_info["path"]).name)
+        # 一次性生成本模型全部演示图像所需的随机数
+        rng_tbl = rng.random((len(demo_images), N_RANDOM_PER_PREDICTION), dtype=np.float32)
+        
+        for i, img_info in enumerate(demo_images):
+            true_answer = img_info["true_answer"]
+            prediction, confidence = simulate_model_prediction(img_info["path"], model_type, rng_tbl[i],
+                                                               true_answer)
             
             is_correct = prediction == true_answer
             
@@ -151,8 +186,9 @@ def run_quick_demo():
             model_results["confidences"].append(confidence)
             model_results["severities"].append(img_info["severity"])
             
-            print(f"  严重程度 {img_info['severity']:.2f}: {prediction} (真实: {true_answer}) "
-                  f"置信度: {confidence:.3f} {'✓' if is_correct else '✗'}")
+            logger.debug("  严重程度 %.2f: %s (真实: %s) 置信度: %.3f %s",
+                         img_info['severity'], prediction, true_answer, confidence,
+                         '✓' if is_correct else '✗')
         
         # 计算失效阈值
         failure_threshold = None
@@ -169,11 +205,11 @@ def run_quick_demo():
         print(f"  失效阈值: {failure_threshold}")
         print(f"  鲁棒性评分: {model_results['robustness_score']:.3f}")
     
-    # 可视化结果
-    plot_demo_results(results)
-    
-    # 生成简单报告
-    generate_demo_report(results)
+    # 可视化结果在后台线程绘制，同时生成简单报告
+    with ThreadPoolExecutor(max_workers=1) as plotter:
+        plot_future = plotter.submit(plot_demo_results, results)
+        generate_demo_report(results)
+        plot_future.result()
     
     print("\n✅ 演示完成！")
     print("📁 输出文件:")
@@ -235,7 +271,7 @@ def plot_demo_results(results):
                 f'{threshold:.2f}', ha='center', va='bottom')
     
     plt.tight_layout()
-    plt.savefig('demo_comparison.png', dpi=300, bbox_inches='tight')
+    plt.savefig('demo_comparison.png', dpi=100, bbox_inches='tight', metadata={})
     plt.close()
 
 def generate_demo_report(results):
@@ -281,4 +317,11 @@ def generate_demo_report(results):
         f.write(report)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="色盲测试数据集评测演示")
+    parser.add_argument("--verbose", action="store_true",
+                        help="输出每张演示图像的预测明细")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(message)s')
+    
     run_quick_demo()
\ No newline at end of file
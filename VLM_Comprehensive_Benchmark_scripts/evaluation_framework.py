@@ -4,13 +4,259 @@
 使用色盲测试数据集评估视觉模型的色彩感知边界
 """
 
+import os
 import json
+import re
+import logging
+import argparse
+import functools
 import numpy as np
 from pathlib import Path
-from PIL import Image
-import matplotlib.pyplot as plt
-from typing import Dict, List, Tuple, Callable
-import cv2
+from typing import Dict, List, Tuple, Callable, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+from answer_extraction import extract_answer
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# 逐图像/逐步骤的进度信息走日志（默认不输出），由调用方配置级别
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# 每条准确率曲线最多绘制的点数，超过时抽样
+MAX_PLOT_POINTS = 5000
+
+# HTML评测报告模板：按段拼接，表格行逐个format后一次join
+_REPORT_HEAD = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>色盲测试数据集模型评测报告</title>
+    <style>
+        body {{ font-family: Arial, sans-serif; margin: 40px; }}
+        .metric {{ margin: 20px 0; padding: 15px; border: 1px solid #ddd; }}
+        .chart {{ margin: 20px 0; }}
+        table {{ border-collapse: collapse; width: 100%; }}
+        th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+        th {{ background-color: #f2f2f2; }}
+    </style>
+</head>
+<body>
+    <h1>色盲测试数据集模型评测报告</h1>
+    
+    <h2>总体指标</h2>
+    <div class="metric">
+        <p><strong>总预测数:</strong> {total_predictions}</p>
+        <p><strong>总体准确率:</strong> {overall_accuracy:.3f}</p>
+        <p><strong>平均置信度:</strong> {mean_confidence:.3f}</p>
+    </div>
+    
+    <h2>各色盲类型表现</h2>
+    <table>
+        <tr>
+            <th>色盲类型</th>
+            <th>准确率</th>
+            <th>平均置信度</th>
+            <th>平均失败阈值</th>
+            <th>鲁棒性评分</th>
+        </tr>
+"""
+
+_REPORT_ROW = """
+        <tr>
+            <td>{cb_type}</td>
+            <td>{accuracy:.3f}</td>
+            <td>{mean_confidence:.3f}</td>
+            <td>{mean_failure_threshold}</td>
+            <td>{robustness:.3f}</td>
+        </tr>
+"""
+
+_REPORT_MID = """
+    </table>
+    
+    <h2>边界分析</h2>
+    <div class="metric">
+"""
+
+_REPORT_DIST = """
+        <p><strong>平均失败阈值:</strong> {mean:.3f}</p>
+        <p><strong>失败阈值标准差:</strong> {std:.3f}</p>
+        <p><strong>失败阈值中位数:</strong> {median:.3f}</p>
+"""
+
+_REPORT_TAIL = """
+    </div>
+    
+    <h2>评测说明</h2>
+    <div class="metric">
+        <p><strong>失败阈值:</strong> 模型开始无法正确识别的色盲严重程度</p>
+        <p><strong>鲁棒性评分:</strong> 1 - 平均失败阈值，越高表示模型越鲁棒</p>
+        <p><strong>色盲严重程度:</strong> 0.0 = 正常视力，1.0 = 完全色盲</p>
+    </div>
+    
+</body>
+</html>
+"""
+
+# 预编译的数字匹配正则（判分热路径使用）
+_DIGIT_RE = re.compile(r'\d+')
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _bin_accuracy(sev, succ, n_bins):
+        """按严重程度分箱统计样本数和成功数（最后一个区间包含1.0）"""
+        counts = np.zeros(n_bins, np.int64)
+        hits = np.zeros(n_bins, np.int64)
+        for i in range(sev.size):
+            b = int(sev[i] * n_bins)
+            if b >= n_bins:
+                b = n_bins - 1
+            counts[b] += 1
+            if succ[i]:
+                hits[b] += 1
+        return counts, hits
+    
+    @njit(cache=True)
+    def _first_failure(succ):
+        """第一个失败步骤的下标，始终成功时返回-1"""
+        for i in range(succ.size):
+            if not succ[i]:
+                return i
+        return -1
+    
+    @njit(cache=True)
+    def _first_recovery(succ):
+        """首次失败之后第一个成功步骤的下标，没有恢复时返回-1"""
+        failed = False
+        for i in range(succ.size):
+            if not succ[i]:
+                failed = True
+            elif failed:
+                return i
+        return -1
+else:
+    def _bin_accuracy(sev, succ, n_bins):
+        """按严重程度分箱统计样本数和成功数（最后一个区间包含1.0）"""
+        idx = np.minimum((sev * n_bins).astype(np.int64), n_bins - 1)
+        counts = np.bincount(idx, minlength=n_bins)
+        hits = np.bincount(idx, weights=succ.astype(np.float64), minlength=n_bins).astype(np.int64)
+        return counts, hits
+    
+    def _first_failure(succ):
+        """第一个失败步骤的下标，始终成功时返回-1"""
+        mask = ~succ
+        return int(mask.argmax()) if mask.any() else -1
+    
+    def _first_recovery(succ):
+        """首次失败之后第一个成功步骤的下标，没有恢复时返回-1"""
+        first = _first_failure(succ)
+        if first < 0:
+            return -1
+        recovered = np.flatnonzero(succ[first:])
+        return first + int(recovered[0]) if recovered.size else -1
+
+
+def _progress(iterable, total: int, desc: str):
+    """有tqdm时显示进度条，否则原样返回"""
+    if tqdm is None:
+        return iterable
+    return tqdm(iterable, total=total, desc=desc)
+
+
+def _json_default(obj):
+    """保存结果时把NumPy数组（各曲线）和标量转换为列表/Python数值（orjson无法直接处理的类型同样走这里）"""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
+
+
+@functools.lru_cache(maxsize=512)
+def _load_image(image_path: str) -> np.ndarray:
+    """解码为只读RGB数组并按路径缓存，重复评测同一图像时不再重复解码"""
+    from PIL import Image  # 仅预加载图像时需要
+    
+    with Image.open(image_path) as img:
+        arr = np.asarray(img.convert('RGB'))
+    arr.flags.writeable = False
+    return arr
+
+
+def _batch_adapter(model_predict_func: Callable) -> Callable:
+    """把单张预测函数包装成批量接口；单张异常作为结果返回，不影响同批其他图像"""
+    def predict_batch(image_paths):
+        outputs = []
+        for image_path in image_paths:
+            try:
+                outputs.append(model_predict_func(image_path))
+            except Exception as e:
+                outputs.append(e)
+        return outputs
+    return predict_batch
+
+
+def _prepare_predictors(model_predict_func: Callable,
+                        model_predict_batch: Optional[Callable],
+                        preload_images: bool) -> Tuple[Callable, Callable]:
+    """按需包装预测函数：预加载时改为传入解码后的数组，并补齐批量接口"""
+    if preload_images:
+        path_predict_func = model_predict_func
+        model_predict_func = lambda image_path: path_predict_func(_load_image(image_path))
+        if model_predict_batch is not None:
+            path_predict_batch = model_predict_batch
+            model_predict_batch = lambda image_paths: path_predict_batch(
+                [_load_image(image_path) for image_path in image_paths])
+    
+    if model_predict_batch is None:
+        model_predict_batch = _batch_adapter(model_predict_func)
+    
+    return model_predict_func, model_predict_batch
+
+
+# 工作进程内的评测器和评测参数，由_init_worker在每个进程中设置一次
+_evaluator = None
+_eval_args = None
+
+
+def _init_worker(evaluator, model_predict_func, confidence_threshold,
+                 model_predict_batch, batch_size, preload_images):
+    """进程池初始化函数：评测器和预测函数每个进程只传输一次"""
+    global _evaluator, _eval_args
+    model_predict_func, model_predict_batch = _prepare_predictors(
+        model_predict_func, model_predict_batch, preload_images)
+    _evaluator = evaluator
+    _eval_args = (model_predict_func, confidence_threshold, model_predict_batch, batch_size)
+
+
+def _evaluate_one_image(image_meta: Dict) -> Dict:
+    """在工作进程中评测单张基础图像的全部色盲序列"""
+    return _evaluator.evaluate_image(image_meta, *_eval_args)
+
+
+def _draw_accuracy_curve(ax, cb_type: str, severities, accuracies):
+    """在给定子图上绘制单个色盲类型的准确率曲线"""
+    ax.plot(severities, accuracies, 'o-', alpha=0.6, label=f'{cb_type}')
+    ax.set_xlabel('色盲严重程度')
+    ax.set_ylabel('准确率')
+    ax.set_title(f'{cb_type.title()} 准确率 vs 色盲严重程度')
+    ax.grid(True, alpha=0.3)
+    ax.legend()
+
 
 class ColorBlindnessEvaluator:
     """色盲测试数据集评测器"""
@@ -19,9 +265,10 @@ class ColorBlindnessEvaluator:
         self.dataset_path = Path(dataset_path)
         self.metadata_path = Path(metadata_path)
         
-        # 加载数据集元数据
-        with open(self.metadata_path, 'r', encoding='utf-8') as f:
-            self.metadata = json.load(f)
+        # 加载数据集元数据（优先使用orjson）
+        with open(self.metadata_path, 'rb') as f:
+            data = f.read()
+        self.metadata = orjson.loads(data) if orjson is not None else json.loads(data)
         
         # 色盲类型
         self.colorblind_types = ['protanopia', 'deuteranopia', 'tritanopia']
@@ -30,13 +277,24 @@ class ColorBlindnessEvaluator:
         self.evaluation_results = {}
         
     def evaluate_model_boundary(self, model_predict_func: Callable, 
-                               confidence_threshold: float = 0.5) -> Dict:
+                               confidence_threshold: float = 0.5,
+                               model_predict_batch: Optional[Callable] = None,
+                               batch_size: int = 32,
+                               preload_images: bool = False,
+                               max_workers: int = 1) -> Dict:
         """
         评测模型的视觉边界
         
         Args:
             model_predict_func: 模型预测函数，输入图像路径，返回(预测结果, 置信度)
             confidence_threshold: 置信度阈值
+            model_predict_batch: 可选的批量预测函数，输入路径列表，返回[(预测结果, 置信度), ...]；
+                                 未提供时按批逐张调用model_predict_func
+            batch_size: 每批送入模型的图像数
+            preload_images: 为True时预测函数收到的是解码后的RGB数组(H, W, 3)而不是路径，
+                            解码结果按路径缓存
+            max_workers: 并行评测的进程数；大于1时各基础图像分发到进程池，
+                         此时预测函数必须可pickle（模块级函数），每个进程各自加载
             
         Returns:
             评测结果字典
@@ -50,31 +308,30 @@ class ColorBlindnessEvaluator:
             "boundary_analysis": {}
         }
         
-        total_sequences = len(self.metadata["images"])
-        
-        for i, image_meta in enumerate(self.metadata["images"]):
-            print(f"评测图像 {i+1}/{total_sequences}: {image_meta['base_image']}")
-            
-            base_image = image_meta['base_image']
-            expected_answer = self.extract_expected_answer(base_image)
-            
-            image_results = {
-                "base_image": base_image,
-                "expected_answer": expected_answer,
-                "colorblind_results": {}
-            }
+        images = self.metadata["images"]
+        total_sequences = len(images)
+        
+        if max_workers > 1:
+            # 各基础图像相互独立，分发到进程池；map保持原有顺序
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(self, model_predict_func, confidence_threshold,
+                          model_predict_batch, batch_size, preload_images))
+            with executor:
+                image_results_iter = executor.map(_evaluate_one_image, images)
+                for i, image_results in enumerate(_progress(image_results_iter, total_sequences, "images")):
+                    logger.info("评测图像 %d/%d: %s", i + 1, total_sequences, image_results['base_image'])
+                    results["per_image_analysis"][image_results["base_image"]] = image_results
+        else:
+            model_predict_func, model_predict_batch = _prepare_predictors(
+                model_predict_func, model_predict_batch, preload_images)
             
-            for cb_type in self.colorblind_types:
-                if cb_type in image_meta["colorblind_variants"]:
-                    cb_result = self.evaluate_colorblind_sequence(
-                        image_meta["colorblind_variants"][cb_type],
-                        model_predict_func,
-                        expected_answer,
-                        confidence_threshold
-                    )
-                    image_results["colorblind_results"][cb_type] = cb_result
-            
-            results["per_image_analysis"][base_image] = image_results
+            for i, image_meta in enumerate(_progress(images, total_sequences, "images")):
+                logger.info("评测图像 %d/%d: %s", i + 1, total_sequences, image_meta['base_image'])
+                image_results = self.evaluate_image(image_meta, model_predict_func, confidence_threshold,
+                                                    model_predict_batch, batch_size)
+                results["per_image_analysis"][image_results["base_image"]] = image_results
         
         # 计算总体指标
         results["overall_metrics"] = self.calculate_overall_metrics(results["per_image_analysis"])
@@ -83,152 +340,231 @@ class ColorBlindnessEvaluator:
         
         return results
     
+    def evaluate_image(self, image_meta: Dict,
+                       model_predict_func: Callable,
+                       confidence_threshold: float,
+                       model_predict_batch: Optional[Callable] = None,
+                       batch_size: int = 32) -> Dict:
+        """评测单张基础图像的全部色盲类型序列"""
+        
+        base_image = image_meta['base_image']
+        expected_answer = self.extract_expected_answer(base_image)
+        # 期望答案只解析一次，整条序列的每一步共用
+        expected_canon = self.canonicalize_expected(expected_answer)
+        
+        image_results = {
+            "base_image": base_image,
+            "expected_answer": expected_answer,
+            "colorblind_results": {}
+        }
+        
+        for cb_type in self.colorblind_types:
+            if cb_type in image_meta["colorblind_variants"]:
+                cb_result = self.evaluate_colorblind_sequence(
+                    image_meta["colorblind_variants"][cb_type],
+                    model_predict_func,
+                    expected_canon,
+                    confidence_threshold,
+                    model_predict_batch,
+                    batch_size
+                )
+                image_results["colorblind_results"][cb_type] = cb_result
+        
+        return image_results
+    
     def evaluate_colorblind_sequence(self, variant_meta: Dict, 
                                    model_predict_func: Callable,
-                                   expected_answer: str,
-                                   confidence_threshold: float) -> Dict:
-        """评测单个色盲类型的梯度序列"""
+                                   expected_canon,
+                                   confidence_threshold: float,
+                                   model_predict_batch: Optional[Callable] = None,
+                                   batch_size: int = 32) -> Dict:
+        """评测单个色盲类型的梯度序列（expected_canon为canonicalize_expected的结果）"""
         
         gradient_files = variant_meta["generated_files"]
         colorblind_type = variant_meta["colorblind_type"]
         
+        n_steps = len(gradient_files)
+        
         sequence_results = {
             "colorblind_type": colorblind_type,
-            "total_steps": len(gradient_files),
+            "total_steps": n_steps,
             "predictions": [],
-            "accuracy_curve": [],
-            "confidence_curve": [],
+            "accuracy_curve": None,
+            "confidence_curve": None,
+            "severity_curve": None,
             "failure_threshold": None,
             "recovery_threshold": None
         }
         
-        print(f"  评测 {colorblind_type} 序列...")
+        # 曲线数据预分配为数组，只记录成功预测的步骤，结束后截取前n_valid项
+        acc = np.empty(n_steps, dtype=np.bool_)
+        suc = np.empty(n_steps, dtype=np.bool_)
+        conf = np.empty(n_steps, dtype=np.float32)
+        sev = np.empty(n_steps, dtype=np.float64)
+        n_valid = 0
         
-        for step, image_path in enumerate(gradient_files):
-            severity = step / (len(gradient_files) - 1)  # 0.0 到 1.0
+        logger.debug("  评测 %s 序列...", colorblind_type)
+        
+        if model_predict_batch is None:
+            model_predict_batch = _batch_adapter(model_predict_func)
+        
+        for start in range(0, n_steps, batch_size):
+            chunk = gradient_files[start:start + batch_size]
             
             try:
-                # 调用模型预测
-                prediction, confidence = model_predict_func(image_path)
-                
-                # 判断预测是否正确
-                is_correct = self.is_prediction_correct(prediction, expected_answer)
-                is_confident = confidence >= confidence_threshold
-                
-                step_result = {
-                    "step": step,
-                    "severity": severity,
-                    "image_path": image_path,
-                    "prediction": prediction,
-                    "confidence": confidence,
-                    "is_correct": is_correct,
-                    "is_confident": is_confident,
-                    "success": is_correct and is_confident
-                }
-                
-                sequence_results["predictions"].append(step_result)
-                sequence_results["accuracy_curve"].append(1.0 if is_correct else 0.0)
-                sequence_results["confidence_curve"].append(confidence)
+                # 整批调用模型预测
+                outputs = model_predict_batch(chunk)
+            except Exception:
+                outputs = None  # 批量预测失败时逐张回退
+            
+            for offset, image_path in enumerate(chunk):
+                step = start + offset
+                severity = step / (n_steps - 1)  # 0.0 到 1.0
                 
-            except Exception as e:
-                print(f"    ✗ 步骤 {step} 预测失败: {e}")
-                sequence_results["predictions"].append({
-                    "step": step,
-                    "severity": severity,
-                    "error": str(e)
-                })
+                try:
+                    if outputs is None:
+                        prediction, confidence = model_predict_func(image_path)
+                    else:
+                        output = outputs[offset]
+                        if isinstance(output, Exception):
+                            raise output
+                        prediction, confidence = output
+                    
+                    # 判断预测是否正确
+                    is_correct = self.is_prediction_correct_canon(prediction, expected_canon)
+                    is_confident = confidence >= confidence_threshold
+                    
+                    acc[n_valid] = is_correct
+                    suc[n_valid] = is_correct and is_confident
+                    conf[n_valid] = confidence
+                    sev[n_valid] = severity
+                    
+                    step_result = {
+                        "step": step,
+                        "severity": severity,
+                        "image_path": image_path,
+                        "prediction": prediction,
+                        "confidence": confidence,
+                        "is_correct": is_correct,
+                        "is_confident": is_confident,
+                        "success": is_correct and is_confident
+                    }
+                    
+                    sequence_results["predictions"].append(step_result)
+                    n_valid += 1
+                    
+                except Exception as e:
+                    logger.warning("    ✗ 步骤 %d 预测失败: %s", step, e)
+                    sequence_results["predictions"].append({
+                        "step": step,
+                        "severity": severity,
+                        "error": str(e)
+                    })
+        
+        sequence_results["accuracy_curve"] = acc[:n_valid]
+        sequence_results["confidence_curve"] = conf[:n_valid]
+        sequence_results["severity_curve"] = sev[:n_valid]
+        sev_arr = sev[:n_valid]
+        suc_arr = suc[:n_valid]
         
         # 分析失败和恢复阈值
-        sequence_results["failure_threshold"] = self.find_failure_threshold(sequence_results["predictions"])
-        sequence_results["recovery_threshold"] = self.find_recovery_threshold(sequence_results["predictions"])
+        sequence_results["failure_threshold"] = self.find_failure_threshold(sev_arr, suc_arr)
+        sequence_results["recovery_threshold"] = self.find_recovery_threshold(sev_arr, suc_arr)
         
         return sequence_results
     
-    def find_failure_threshold(self, predictions: List[Dict]) -> float:
+    def find_failure_threshold(self, sev_arr: np.ndarray, suc_arr: np.ndarray) -> float:
         """找到模型开始失败的色盲严重程度阈值"""
-        for pred in predictions:
-            if "success" in pred and not pred["success"]:
-                return pred["severity"]
+        i = _first_failure(suc_arr)
+        if i >= 0:
+            return float(sev_arr[i])
         return 1.0  # 如果始终成功
     
-    def find_recovery_threshold(self, predictions: List[Dict]) -> float:
+    def find_recovery_threshold(self, sev_arr: np.ndarray, suc_arr: np.ndarray) -> float:
         """找到模型从失败中恢复的阈值（如果有的话）"""
-        failed = False
-        for pred in predictions:
-            if "success" in pred:
-                if not pred["success"]:
-                    failed = True
-                elif failed and pred["success"]:
-                    return pred["severity"]
+        i = _first_recovery(suc_arr)
+        if i >= 0:
+            return float(sev_arr[i])
         return None  # 没有恢复
     
     def calculate_overall_metrics(self, per_image_analysis: Dict) -> Dict:
-        """计算总体评测指标"""
+        """计算总体评测指标（逐序列累加，不汇总全部预测）"""
         
-        all_predictions = []
-        for image_results in per_image_analysis.values():
-            for cb_type, cb_results in image_results["colorblind_results"].items():
-                all_predictions.extend(cb_results["predictions"])
+        n_bins = 10  # 按严重程度划分的区间数，最后一个区间包含1.0
+        bin_count = np.zeros(n_bins, dtype=np.int64)
+        bin_success = np.zeros(n_bins, dtype=np.int64)
+        confidence_sum = 0.0
         
-        # 过滤出有效预测
-        valid_predictions = [p for p in all_predictions if "success" in p]
+        for image_results in per_image_analysis.values():
+            for cb_results in image_results["colorblind_results"].values():
+                # 跳过预测失败的步骤
+                valid = [p for p in cb_results["predictions"] if "success" in p]
+                if not valid:
+                    continue
+                sev = np.array([p["severity"] for p in valid], dtype=np.float64)
+                suc = np.array([p["success"] for p in valid], dtype=np.bool_)
+                confidence_sum += sum(p["confidence"] for p in valid)
+                
+                counts, hits = _bin_accuracy(sev, suc, n_bins)
+                bin_count += counts
+                bin_success += hits
         
-        if not valid_predictions:
+        total_predictions = int(bin_count.sum())
+        if not total_predictions:
             return {"error": "没有有效预测"}
         
-        total_predictions = len(valid_predictions)
-        successful_predictions = sum(1 for p in valid_predictions if p["success"])
-        
         # 按严重程度分组计算准确率
-        severity_bins = np.linspace(0, 1, 11)  # 10个区间
         severity_accuracy = []
-        
-        for i in range(len(severity_bins) - 1):
-            bin_start, bin_end = severity_bins[i], severity_bins[i + 1]
-            bin_predictions = [p for p in valid_predictions 
-                             if bin_start <= p["severity"] < bin_end]
-            
-            if bin_predictions:
-                bin_accuracy = sum(1 for p in bin_predictions if p["success"]) / len(bin_predictions)
-                severity_accuracy.append({
-                    "severity_range": f"{bin_start:.1f}-{bin_end:.1f}",
-                    "accuracy": bin_accuracy,
-                    "sample_count": len(bin_predictions)
-                })
+        for i in np.flatnonzero(bin_count):
+            severity_accuracy.append({
+                "severity_range": f"{i / n_bins:.1f}-{(i + 1) / n_bins:.1f}",
+                "accuracy": int(bin_success[i]) / int(bin_count[i]),
+                "sample_count": int(bin_count[i])
+            })
         
         return {
             "total_predictions": total_predictions,
-            "overall_accuracy": successful_predictions / total_predictions,
-            "mean_confidence": np.mean([p["confidence"] for p in valid_predictions]),
+            "overall_accuracy": int(bin_success.sum()) / total_predictions,
+            "mean_confidence": confidence_sum / total_predictions,
             "severity_accuracy_breakdown": severity_accuracy
         }
     
     def calculate_per_type_metrics(self, per_image_analysis: Dict) -> Dict:
-        """计算每种色盲类型的指标"""
+        """计算每种色盲类型的指标（单次遍历累加计数、成功数和置信度和）"""
         
         type_metrics = {}
         
         for cb_type in self.colorblind_types:
-            type_predictions = []
+            n = 0
+            successful = 0
+            confidence_sum = 0.0
             failure_thresholds = []
             
             for image_results in per_image_analysis.values():
-                if cb_type in image_results["colorblind_results"]:
-                    cb_results = image_results["colorblind_results"][cb_type]
-                    type_predictions.extend([p for p in cb_results["predictions"] if "success" in p])
-                    
-                    if cb_results["failure_threshold"] is not None:
-                        failure_thresholds.append(cb_results["failure_threshold"])
-            
-            if type_predictions:
-                successful = sum(1 for p in type_predictions if p["success"])
+                cb_results = image_results["colorblind_results"].get(cb_type)
+                if cb_results is None:
+                    continue
+                
+                failure_threshold = cb_results["failure_threshold"]
+                if failure_threshold is not None:
+                    failure_thresholds.append(failure_threshold)
                 
+                for p in cb_results["predictions"]:
+                    success = p.get("success")
+                    if success is None:
+                        continue
+                    n += 1
+                    successful += success
+                    confidence_sum += p["confidence"]
+            
+            if n:
+                thresholds = np.asarray(failure_thresholds, dtype=np.float64)
                 type_metrics[cb_type] = {
-                    "total_predictions": len(type_predictions),
-                    "accuracy": successful / len(type_predictions),
-                    "mean_confidence": np.mean([p["confidence"] for p in type_predictions]),
-                    "mean_failure_threshold": np.mean(failure_thresholds) if failure_thresholds else None,
-                    "failure_threshold_std": np.std(failure_thresholds) if failure_thresholds else None
+                    "total_predictions": n,
+                    "accuracy": successful / n,
+                    "mean_confidence": confidence_sum / n,
+                    "mean_failure_threshold": float(thresholds.mean()) if thresholds.size else None,
+                    "failure_threshold_std": float(thresholds.std()) if thresholds.size else None
                 }
         
         return type_metrics
@@ -276,125 +612,92 @@ class ColorBlindnessEvaluator:
     def generate_evaluation_report(self, results: Dict, output_path: str = "evaluation_report.html"):
         """生成评测报告"""
         
-        html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>色盲测试数据集模型评测报告</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 40px; }}
-        .metric {{ margin: 20px 0; padding: 15px; border: 1px solid #ddd; }}
-        .chart {{ margin: 20px 0; }}
-        table {{ border-collapse: collapse; width: 100%; }}
-        th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-        th {{ background-color: #f2f2f2; }}
-    </style>
-</head>
-<body>
-    <h1>色盲测试数据集模型评测报告</h1>
-    
-    <h2>总体指标</h2>
-    <div class="metric">
-        <p><strong>总预测数:</strong> {results['overall_metrics'].get('total_predictions', 'N/A')}</p>
-        <p><strong>总体准确率:</strong> {results['overall_metrics'].get('overall_accuracy', 0):.3f}</p>
-        <p><strong>平均置信度:</strong> {results['overall_metrics'].get('mean_confidence', 0):.3f}</p>
-    </div>
-    
-    <h2>各色盲类型表现</h2>
-    <table>
-        <tr>
-            <th>色盲类型</th>
-            <th>准确率</th>
-            <th>平均置信度</th>
-            <th>平均失败阈值</th>
-            <th>鲁棒性评分</th>
-        </tr>
-"""
+        overall = results['overall_metrics']
+        parts = [_REPORT_HEAD.format(
+            total_predictions=overall.get('total_predictions', 'N/A'),
+            overall_accuracy=overall.get('overall_accuracy', 0),
+            mean_confidence=overall.get('mean_confidence', 0)
+        )]
         
+        type_comparison = results["boundary_analysis"]["type_comparison"]
         for cb_type, metrics in results["per_colorblind_type"].items():
-            robustness = results["boundary_analysis"]["type_comparison"].get(cb_type, {}).get("robustness_score", 0)
-            html_content += f"""
-        <tr>
-            <td>{cb_type}</td>
-            <td>{metrics.get('accuracy', 0):.3f}</td>
-            <td>{metrics.get('mean_confidence', 0):.3f}</td>
-            <td>{metrics.get('mean_failure_threshold', 'N/A')}</td>
-            <td>{robustness:.3f}</td>
-        </tr>
-"""
+            parts.append(_REPORT_ROW.format(
+                cb_type=cb_type,
+                accuracy=metrics.get('accuracy', 0),
+                mean_confidence=metrics.get('mean_confidence', 0),
+                mean_failure_threshold=metrics.get('mean_failure_threshold', 'N/A'),
+                robustness=type_comparison.get(cb_type, {}).get("robustness_score", 0)
+            ))
         
-        html_content += """
-    </table>
-    
-    <h2>边界分析</h2>
-    <div class="metric">
-"""
+        parts.append(_REPORT_MID)
         
         if "global_failure_distribution" in results["boundary_analysis"]:
             dist = results["boundary_analysis"]["global_failure_distribution"]
-            html_content += f"""
-        <p><strong>平均失败阈值:</strong> {dist.get('mean', 0):.3f}</p>
-        <p><strong>失败阈值标准差:</strong> {dist.get('std', 0):.3f}</p>
-        <p><strong>失败阈值中位数:</strong> {dist.get('median', 0):.3f}</p>
-"""
+            parts.append(_REPORT_DIST.format(
+                mean=dist.get('mean', 0),
+                std=dist.get('std', 0),
+                median=dist.get('median', 0)
+            ))
         
-        html_content += """
-    </div>
-    
-    <h2>评测说明</h2>
-    <div class="metric">
-        <p><strong>失败阈值:</strong> 模型开始无法正确识别的色盲严重程度</p>
-        <p><strong>鲁棒性评分:</strong> 1 - 平均失败阈值，越高表示模型越鲁棒</p>
-        <p><strong>色盲严重程度:</strong> 0.0 = 正常视力，1.0 = 完全色盲</p>
-    </div>
-    
-</body>
-</html>
-"""
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        parts.append(_REPORT_TAIL)
+        Path(output_path).write_text("".join(parts), encoding='utf-8')
         
         print(f"✓ 评测报告已保存到: {output_path}")
     
     def plot_accuracy_curves(self, results: Dict, output_dir: str = "evaluation_plots"):
         """绘制准确率曲线"""
         
+        # 只在绘图时导入matplotlib，纯评测/导出JSON的调用不承担其导入开销
+        import matplotlib
+        matplotlib.use("Agg")  # 只输出文件，不需要GUI后端
+        import matplotlib.pyplot as plt
+        
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
         
-        # 为每种色盲类型绘制准确率曲线
-        for cb_type in self.colorblind_types:
-            plt.figure(figsize=(10, 6))
+        # 三种色盲类型画在同一张图的子图中，只需一次savefig
+        fig, axes = plt.subplots(1, len(self.colorblind_types), figsize=(18, 5), sharey=True, squeeze=False)
+        plotted = False
+        for i, cb_type in enumerate(self.colorblind_types):
+            # 先收集各序列曲线并统计总点数，再一次性填入预分配数组
+            curves = []
+            for image_results in results["per_image_analysis"].values():
+                cb_results = image_results["colorblind_results"].get(cb_type)
+                if cb_results is None:
+                    continue
+                accuracies = cb_results["accuracy_curve"]
+                severities = cb_results.get("severity_curve")
+                if severities is None:
+                    # 兼容没有severity_curve的旧结果：准确率曲线只对应有效预测
+                    severities = [p["severity"] for p in cb_results["predictions"] if "success" in p]
+                
+                if len(accuracies) and len(severities) == len(accuracies):
+                    curves.append((severities, accuracies))
             
-            all_severities = []
-            all_accuracies = []
+            total = sum(len(accuracies) for _, accuracies in curves)
+            if not total:
+                continue
             
-            for image_results in results["per_image_analysis"].values():
-                if cb_type in image_results["colorblind_results"]:
-                    cb_results = image_results["colorblind_results"][cb_type]
-                    severities = [p["severity"] for p in cb_results["predictions"] if "severity" in p]
-                    accuracies = cb_results["accuracy_curve"]
-                    
-                    if len(severities) == len(accuracies):
-                        all_severities.extend(severities)
-                        all_accuracies.extend(accuracies)
+            all_severities = np.empty(total, dtype=np.float32)
+            all_accuracies = np.empty(total, dtype=np.float32)
+            pos = 0
+            for severities, accuracies in curves:
+                n = len(accuracies)
+                all_severities[pos:pos + n] = severities
+                all_accuracies[pos:pos + n] = accuracies
+                pos += n
             
-            if all_severities and all_accuracies:
-                # 按严重程度排序
-                sorted_data = sorted(zip(all_severities, all_accuracies))
-                severities, accuracies = zip(*sorted_data)
-                
-                plt.plot(severities, accuracies, 'o-', alpha=0.6, label=f'{cb_type}')
-                plt.xlabel('色盲严重程度')
-                plt.ylabel('准确率')
-                plt.title(f'{cb_type.title()} 准确率 vs 色盲严重程度')
-                plt.grid(True, alpha=0.3)
-                plt.legend()
-                
-                plt.tight_layout()
-                plt.savefig(output_path / f'{cb_type}_accuracy_curve.png', dpi=300, bbox_inches='tight')
-                plt.close()
+            # 按严重程度排序；点数远超像素数时等间隔抽样
+            order = np.argsort(all_severities, kind='stable')
+            stride = max(1, total // MAX_PLOT_POINTS)
+            _draw_accuracy_curve(axes[0, i], cb_type,
+                                 all_severities[order][::stride], all_accuracies[order][::stride])
+            plotted = True
+        
+        if plotted:
+            fig.tight_layout()
+            fig.savefig(output_path / 'accuracy_curves.png', dpi=120, bbox_inches='tight', metadata={})
+        plt.close(fig)
         
         print(f"✓ 准确率曲线已保存到: {output_path}")
     
@@ -405,34 +708,59 @@ class ColorBlindnessEvaluator:
         if expected.lower() == "unknown":
             return True  # 如果期望答案未知，认为预测正确
         
-        # 提取数字或关键词进行比较
-        import re
-        pred_numbers = re.findall(r'\d+', str(prediction))
-        expected_numbers = re.findall(r'\d+', str(expected))
+        p = str(prediction)
+        e = str(expected)
+        
+        # 快速路径：两者都是纯数字时无需正则
+        if p.isdigit() and e.isdigit():
+            return p == e
         
-        if pred_numbers and expected_numbers:
-            return pred_numbers[0] == expected_numbers[0]
+        # 提取第一个数字进行比较
+        pred_number = _DIGIT_RE.search(p)
+        expected_number = _DIGIT_RE.search(e)
+        
+        if pred_number and expected_number:
+            return pred_number.group() == expected_number.group()
         
         # 关键词比较
-        return str(prediction).lower() == str(expected).lower()
+        return p.lower() == e.lower()
     
-    def extract_expected_answer(self, filename: str) -> str:
-        """从文件名提取期望答案"""
-        import re
-        filename_lower = filename.lower()
+    @staticmethod
+    def canonicalize_expected(expected: str):
+        """预先解析期望答案，返回(第一个数字串或None, 小写字符串)；未知答案返回None
         
-        # 检查数字
-        numbers = re.findall(r'\d+', filename)
-        if numbers:
-            return numbers[0]
+        数字按字符串比较（"08"与"8"不相等），与is_prediction_correct一致。
+        """
+        e = str(expected)
+        if e.lower() == "unknown":
+            return None
+        if e.isdecimal():
+            return e, e
+        expected_number = _DIGIT_RE.search(e)
+        return (expected_number.group() if expected_number else None), e.lower()
+    
+    @staticmethod
+    def is_prediction_correct_canon(prediction: str, expected_canon) -> bool:
+        """与预解析的期望答案比较，每次只需解析预测结果"""
+        if expected_canon is None:
+            return True  # 如果期望答案未知，认为预测正确
         
-        # 检查关键词
-        keywords = ['circle', 'square', 'triangle', 'diamond', 'star']
-        for keyword in keywords:
-            if keyword in filename_lower:
-                return keyword
+        p = str(prediction)
+        expected_number, expected_lower = expected_canon
+        if expected_number is not None:
+            # 数字答案：比较预测中的第一个数字串
+            if p.isdecimal():
+                return p == expected_number
+            pred_number = _DIGIT_RE.search(p)
+            if pred_number:
+                return pred_number.group() == expected_number
         
-        return "unknown"
+        # 关键词比较
+        return p.lower() == expected_lower
+    
+    def extract_expected_answer(self, filename: str) -> str:
+        """从文件名提取期望答案（共享实现，按文件名缓存）"""
+        return extract_answer(filename)
 
 
 # 示例使用
@@ -457,9 +785,48 @@ def example_model_predict(image_path: str) -> Tuple[str, float]:
     return predicted_number, confidence
 
 
+# 示例批量预测使用的随机数生成器及创建它的进程号；
+# fork出的工作进程会继承父进程的生成器状态，因此在每个进程中首次使用时重新创建
+_example_rng = None
+_example_rng_pid = None
+
+
+def _get_example_rng():
+    """返回当前进程的示例随机数生成器，避免各进程产生相同的预测序列"""
+    global _example_rng, _example_rng_pid
+    if _example_rng_pid != os.getpid():
+        _example_rng = np.random.default_rng()
+        _example_rng_pid = os.getpid()
+    return _example_rng
+
+
+def example_model_predict_batch(image_paths: List[str]) -> List[Tuple[str, float]]:
+    """
+    示例批量预测函数：一次生成整批的随机预测，与example_model_predict行为相同
+    
+    Args:
+        image_paths: 图像文件路径列表
+        
+    Returns:
+        [(预测结果, 置信度), ...]
+    """
+    n = len(image_paths)
+    rng = _get_example_rng()
+    numbers = rng.integers(1, 10, size=n)
+    confidences = rng.uniform(0.3, 0.95, size=n)
+    return [(str(number), float(confidence)) for number, confidence in zip(numbers.tolist(), confidences)]
+
+
 def main():
     """主函数：演示如何使用评测框架"""
     
+    parser = argparse.ArgumentParser(description="色盲测试数据集模型评测框架")
+    parser.add_argument("--verbose", action="store_true",
+                        help="输出逐图像、逐序列的评测进度")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(message)s')
+    
     print("🎯 色盲测试数据集模型评测框架")
     print("=" * 50)
     
@@ -470,16 +837,23 @@ def main():
     print("使用示例模型进行评测...")
     results = evaluator.evaluate_model_boundary(
         model_predict_func=example_model_predict,
-        confidence_threshold=0.7
+        model_predict_batch=example_model_predict_batch,
+        confidence_threshold=0.7,
+        max_workers=os.cpu_count() or 1
     )
     
     # 生成报告
     evaluator.generate_evaluation_report(results)
     evaluator.plot_accuracy_curves(results)
     
-    # 保存结果
-    with open("evaluation_results.json", 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    # 保存结果（优先使用orjson，曲线数组直接序列化）
+    if orjson is not None:
+        with open("evaluation_results.json", 'wb') as f:
+            f.write(orjson.dumps(results, default=_json_default,
+                                 option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open("evaluation_results.json", 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False, default=_json_default)
     
     print("\n✅ 评测完成！")
     print("📁 输出文件:")
@@ -3,6 +3,8 @@
 处理现有图像 - 直接使用已下载的图像生成色盲测试数据集
 """
 
+import argparse
+import os
 import sys
 from pathlib import Path
 
@@ -10,12 +12,17 @@ from pathlib import Path
 scripts_dir = Path(__file__).parent / "scripts"
 sys.path.insert(0, str(scripts_dir))
 
-from scripts.colorblind_simulation import ColorBlindnessSimulator
+from scripts.colorblind_simulation import ColorBlindnessSimulator, FrameWriter, GRADIENT_SAVE_OPTIONS
 import json
 import time
+import numpy as np
 from PIL import Image
 
-def main():
+# 保存帧的线程数：生成帧的JIT内核已占用所有核心，编码线程只取少量
+SAVE_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+
+
+def main(output_format='png'):
     print("🎨 色盲测试数据集处理器")
     print("=" * 50)
     print("使用现有的真实网络图像生成完整数据集")
@@ -51,6 +58,9 @@ def main():
     colorblind_types = ['protanopia', 'deuteranopia', 'tritanopia']
     gradient_steps = 100
     
+    # 各严重程度的变换矩阵只计算一次，由所有图像共用
+    matrices = simulator.severity_matrices(colorblind_types, gradient_steps)
+    
     print(f"\n开始处理图像...")
     print(f"- 色盲类型: {len(colorblind_types)} 种")
     print(f"- 梯度步数: {gradient_steps} 步")
@@ -65,6 +75,11 @@ def main():
     }
     
     total_generated = 0
+    save_options = GRADIENT_SAVE_OPTIONS[output_format]
+    
+    # 帧的编码和写盘交给后台线程并行完成，主线程继续生成下一帧；
+    # 同时等待保存的帧数有上限，避免所有帧同时驻留内存
+    writer = FrameWriter(max_workers=SAVE_WORKERS)
     
     for i, image_file in enumerate(image_files):
         print(f"\n处理图像 {i+1}/{len(image_files)}: {image_file.name}")
@@ -74,6 +89,9 @@ def main():
             image = Image.open(image_file).convert('RGB')
             print(f"  图像尺寸: {image.size}")
             
+            # 只转换一次为数组，所有色盲类型和严重程度复用
+            img_arr = np.asarray(image, dtype=np.uint8)
+            
             # 为每种色盲类型生成梯度
             image_metadata = {
                 "base_image": image_file.name,
@@ -92,22 +110,24 @@ def main():
                 # 生成梯度序列
                 generated_files = []
                 
-                for step in range(gradient_steps + 1):
+                # 帧由模拟器的JIT内核或批量einsum直接生成，不再逐步调用simulate_*
+                frames = simulator.iter_severity_frames(img_arr, matrices[colorblind_type])
+                
+                for step, frame in enumerate(frames):
                     severity = step / gradient_steps
                     
-                    # 应用色盲模拟
-                    sim_func = getattr(simulator, f'simulate_{colorblind_type}')
-                    simulated_image = sim_func(image, severity)
-                    
                     # 保存图像
-                    filename = f"step_{step:03d}_severity_{severity:.2f}.png"
+                    filename = f"step_{step:03d}_severity_{severity:.2f}.{output_format}"
                     filepath = type_output_dir / filename
-                    simulated_image.save(filepath)
+                    writer.save(frame, filepath, **save_options)
                     generated_files.append(str(filepath))
                     
                     if step % 20 == 0:  # 每20步显示一次进度
                         print(f"    进度: {step}/{gradient_steps}")
                 
+                # 等待本类型剩余的帧写完，保存失败时在此抛出
+                writer.wait()
+                
                 # 分析对比度变化
                 try:
                     contrast_analysis = simulator.analyze_color_contrast(
@@ -136,6 +156,8 @@ def main():
             print(f"  ✗ 处理失败: {e}")
             continue
     
+    writer.close()
+    
     # 保存数据集元数据
     metadata_file = metadata_dir / "final_dataset.json"
     with open(metadata_file, 'w', encoding='utf-8') as f:
@@ -277,5 +299,10 @@ data/
     print(f"✓ README文档保存到: {readme_file}")
 
 if __name__ == "__main__":
-    success = main()
+    parser = argparse.ArgumentParser(description="使用现有图像生成色盲测试数据集")
+    parser.add_argument("--format", choices=sorted(GRADIENT_SAVE_OPTIONS), default="png",
+                        help="梯度图像格式：png（快速压缩）或webp（无损，文件更小）")
+    args = parser.parse_args()
+    
+    success = main(output_format=args.format)
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -83,7 +83,7 @@ def generate_complete_dataset():
                     # 应用不同的变换
                     if transform_type == "noise":
                         # 高斯噪声
-                        img_array = np.array(image)
+                        img_array = np.asarray(image)
                         noise = np.random.normal(0, intensity * 30, img_array.shape)
                         result = np.clip(img_array + noise, 0, 255).astype(np.uint8)
                         transformed = Image.fromarray(result)
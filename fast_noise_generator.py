@@ -14,7 +14,7 @@ def apply_noise_gradient(image, gradient_level):
     intensity = gradient_level / 99.0
     
     # 转换为numpy数组
-    img_array = np.array(image)
+    img_array = np.asarray(image)
     
     # 应用高斯噪声
     noise = np.random.normal(0, intensity * 25, img_array.shape)
@@ -69,7 +69,7 @@ class NoiseGradientGenerator:
 
     def apply_gaussian_noise(self, image, intensity):
         """应用高斯噪声"""
-        img_array = np.array(image)
+        img_array = np.asarray(image)
         noise = np.random.normal(0, intensity * 50, img_array.shape)
         noisy_array = np.clip(img_array + noise, 0, 255).astype(np.uint8)
         return Image.fromarray(noisy_array)
@@ -861,7 +861,7 @@ class UltraRelationGenerator:
             radius = intensity * 5
             return base_image.filter(ImageFilter.GaussianBlur(radius=radius))
         elif effect_type == "noise":
-            img_array = np.array(base_image)
+            img_array = np.asarray(base_image)
             noise = np.random.normal(0, intensity * 25, img_array.shape)
             noisy = np.clip(img_array + noise, 0, 255).astype(np.uint8)
             return Image.fromarray(noisy)